@@ -1,101 +1,162 @@
 import datetime
-import base64
 import os
+import time
+import functools
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from pymongo import MongoClient
-from deepface import DeepFace
-from insightface.app import FaceAnalysis
-import mediapipe as mp
-import cv2
-import requests
+from pymongo.write_concern import WriteConcern
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
-import uuid
-from collections import defaultdict
-from bson import Binary
+import atexit
+import threading
+from bson import ObjectId
+from embedding_cache import EmbeddingCache
+from challenge_sessions import ChallengeSessions
+from embedding_codec import encode_embedding, decode_embedding
+from gallery import FaceGallery
+from batcher import MicroBatcher
+from face_pipeline import (detect_and_embed_batch, build_frame_analysis, check_frame, check_session_frame, PoseTracker,
+                           continuity_embedding,
+                           warm_up, model_status, profile_for, active_profiles, PROFILES, CHALLENGE_SESSIONS)
+from worker_pool import ModelWorkerPool, PoolBusy
+from geocoding import geocoder_from_env, UNKNOWN_LOCATION
+from audit_log import AuditLogWriter
+from ingest import read_image_field, decode_data_url, decode_frame, ImageTooLarge
+from rollups import Rollups
+from schema import ensure_indexes
+from log_store import log_store_from_env, build_log_query, encode_log_cursor, top_rejected_pipeline
+from image_store import AsyncImageUploader, image_store_from_env, store_user_image, user_image_key
+from metrics import registry as metrics, mongo_command_listener, SamplingProfiler
+from response_cache import cached_json
 
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor"])  # /get-logs pagination cursor
 UPLOAD_FOLDER = '/path/to/the/uploads'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("max_request_bytes", 32 * 1024 * 1024))
 img1_path = "test.png"
 
 
+# Request latency and status counts for every route, labelled by the route pattern
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start, route=route)
+        metrics.inc("http_requests_total", route=route, status=response.status_code)
+    return response
+
+
 load_dotenv()
 URI = os.getenv("mongo_URI")
-client = MongoClient(URI)
+# Every Mongo command is timed into mongo_command_duration_seconds unless mongo_metrics=false
+MONGO_METRICS = os.getenv("mongo_metrics", "true").lower() == "true"
+client = MongoClient(URI, connect=False, event_listeners=[mongo_command_listener()] if MONGO_METRICS else [])
 db = client['Liveliness']
 User = db['Users']
-Logs = db["Logs"]
 Admins = db["Admins"]
 ChallengeLogs = db["ChallengeLogs"]
-
-azure_string = os.getenv("azure_string")
-container = os.getenv("container")
-AZURE_CONNECTION_STRING = azure_string
-AZURE_CONTAINER_NAME = container
-
-blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
-
-def upload_to_azure_blob(file_bytes, filename):
-    blob_name = f"{uuid.uuid4().hex}_{filename}"
-    blob_client = container_client.get_blob_client(blob_name)
-    blob_client.upload_blob(file_bytes, overwrite=True)
-    return f"https://visiondetect.blob.core.windows.net/{AZURE_CONTAINER_NAME}/{blob_name}"
-
-face = FaceAnalysis(name="buffalo_l")
-face.prepare(ctx_id=0, det_size=(640, 640))
-
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+ChallengeStats = db["ChallengeStats"]  # one document per day of per-pose attempt counts
+ChallengeStatsFast = ChallengeStats.with_options(write_concern=WriteConcern(w=0))
+rollups = Rollups(db)
+# Logs, in one collection or bucketed by month (log_storage=single|monthly)
+log_store = log_store_from_env(db)
+
+
+# The indexes every query relies on (schema.py), created once at start-up rather than in handlers
+def ensure_schema():
+    ensure_indexes(db)
+    log_store.ensure_indexes()
+
+
+if os.getenv("ensure_indexes_on_start", "true").lower() == "true" and __name__ != "__mp_main__":
+    threading.Thread(target=ensure_schema, daemon=True).start()
+
+# Face images go to a separate store (Azure blob, or a local directory with image_store=filesystem)
+# through a background uploader, never into the Users documents
+image_uploader = AsyncImageUploader(image_store_from_env(), max_workers=int(os.getenv("image_upload_workers", 4)),
+                                    max_retries=int(os.getenv("image_upload_retries", 3)))
+atexit.register(image_uploader.close)
+
+
+# Users.face_embedding is written as packed binary (float32, float16 or int8)
+EMBEDDING_STORAGE_DTYPE = os.getenv("embedding_storage_dtype", "float32")
+
+# Reference embeddings for /verify, kept normalized so the hot path never touches Mongo
+embedding_cache = EmbeddingCache(max_size=int(os.getenv("embedding_cache_size", 10000)),
+                                 ttl=int(os.getenv("embedding_cache_ttl", 600)))
+
+# 1:N gallery for /identify, built from the Users collection on first use. This process's
+# /register adds to it directly; users enrolled by other workers, replicas or bulk_enroll.py
+# are picked up by an incremental reload (by _id) at most gallery_refresh_interval seconds
+# later, so that is how stale /identify can be. Deleted users stay until a restart.
+gallery = FaceGallery(ann_threshold=int(os.getenv("gallery_ann_threshold", 50000)))
+GALLERY_REFRESH_INTERVAL = float(os.getenv("gallery_refresh_interval", 60))  # <= 0 disables reloads
+GALLERY_REFRESH_OVERLAP = 60  # seconds re-read before the last sync, for clock skew and slow inserts
+gallery_synced_at = None
+gallery_lock = threading.Lock()
+
+
+def get_gallery():
+    global gallery_synced_at
+    if gallery_synced_at is not None and (GALLERY_REFRESH_INTERVAL <= 0 or
+                                          time.time() - gallery_synced_at < GALLERY_REFRESH_INTERVAL):
+        return gallery
+    # The first load blocks every caller; a reload is done by one request while the others
+    # keep searching the current gallery
+    if not gallery_lock.acquire(blocking=gallery_synced_at is None):
+        return gallery
+    try:
+        if gallery_synced_at is None or time.time() - gallery_synced_at >= GALLERY_REFRESH_INTERVAL:
+            started = time.time()
+            since = None
+            if gallery_synced_at is not None:
+                since = datetime.datetime.fromtimestamp(gallery_synced_at - GALLERY_REFRESH_OVERLAP,
+                                                        datetime.timezone.utc)
+            gallery.load_from_collection(User, since=since)
+            gallery_synced_at = started
+    finally:
+        gallery_lock.release()
+    return gallery
+
+
+def start_of_today():
+    return datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Date ranges read by the dashboard endpoints; the sync routes below and the async ones in
+# asgi.py fetch these from the rollups and share the summary functions
+def active_users_ranges(today):
+    tomorrow = today + datetime.timedelta(days=1)
+    return {
+        "this_week": (today - datetime.timedelta(days=6), tomorrow),
+        "previous_week": (today - datetime.timedelta(days=13), today - datetime.timedelta(days=6))
+    }
 
 
 def get_active_users_by_day():
-    today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    today = start_of_today()
+    ranges = active_users_ranges(today)
+    return active_users_summary(today, rollups.active_users_per_day(*ranges["this_week"]),
+                                rollups.unique_active_users(*ranges["this_week"]),
+                                rollups.unique_active_users(*ranges["previous_week"]))
+
 
+# daily_counts: unique users per day with login_status true, from the ActiveUserDays rollup
+def active_users_summary(today, daily_counts, total_active_users, prev_active_users):
     # Last 7 days (including today)
     last_7_days = [(today - datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
-
-    # Get all registered emails
-    registered_emails = set(user["email"] for user in User.find({}))
-
-    # Query logs for the last 7 days with login_status true
-    query = {
-        "timestamp": {"$gte": today - datetime.timedelta(days=6), "$lt": today + datetime.timedelta(days=1)},
-        "login_status": True
-    }
-    all_logs = list(Logs.find(query))
-
-    # Filter logs to only those by registered users
-    filtered_logs = [log for log in all_logs if log["email"] in registered_emails]
-
-    # Count unique users per day
-    daily_user_set = defaultdict(set)
-    for log in filtered_logs:
-        date_str = log["timestamp"].strftime('%Y-%m-%d')
-        daily_user_set[date_str].add(log["email"])
-
-    active_users_per_day = [len(daily_user_set[day]) for day in last_7_days]
-
-    # Total unique active users across the 7-day span
-    total_active_users = len(set(email for emails in daily_user_set.values() for email in emails))
-
-    # Previous 7-day period
-    prev_query = {
-        "timestamp": {
-            "$gte": today - datetime.timedelta(days=13),
-            "$lt": today - datetime.timedelta(days=6)
-        },
-        "login_status": True
-    }
-    prev_logs = list(Logs.find(prev_query))
-    prev_filtered_logs = [log for log in prev_logs if log["email"] in registered_emails]
-    prev_active_users = len(set(log["email"] for log in prev_filtered_logs))
+    active_users_per_day = [daily_counts.get(day, 0) for day in last_7_days]
 
     # Calculate percentage change
     if prev_active_users == 0:
@@ -117,10 +178,10 @@ def get_active_users_by_day():
 # Function to decode base64 image from frontend
 def decode_image(img_base64):
     try:
-        img_data = base64.b64decode(img_base64)
-        np_arr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        return img
+        img_data = decode_data_url(img_base64)
+        return decode_frame(img_data) if img_data else None
+    except ImageTooLarge:
+        raise
     except Exception as e:
         print("Error decoding image:", e)
         return None
@@ -140,87 +201,174 @@ def decode_image(img_base64):
 #         return None
 
 
-# Function to get stored reference embeddings from MongoDB
+# Normalize an embedding into a contiguous float32 unit vector
+def normalize_embedding(embedding):
+    embedding = np.asarray(embedding, dtype=np.float32)
+    return np.ascontiguousarray(embedding / np.linalg.norm(embedding))
+
+
+# Function to get stored reference embeddings (cache first, then MongoDB)
 def get_reference_embedding(email):
-    user = User.find_one({"email": email})
+    cached = embedding_cache.get(email)
+    if cached is not None:
+        return cached
+
+    user = User.find_one({"email": email}, {"face_embedding": 1, "_id": 0})
     if user and "face_embedding" in user:
-        return np.array(user["face_embedding"])
+        embedding = normalize_embedding(decode_embedding(user["face_embedding"]))
+        embedding_cache.put(email, embedding)
+        return embedding
     return None
 
 
+# One micro-batcher per inference profile in use; endpoints pick theirs with profile_for()
+face_batchers = {profile: MicroBatcher(functools.partial(detect_and_embed_batch, profile=profile),
+                                       max_batch_size=int(os.getenv("embedding_batch_size", 8)),
+                                       max_wait_ms=float(os.getenv("embedding_batch_wait_ms", 5)))
+                 for profile in active_profiles()}
+
+
+def get_face_batcher(endpoint):
+    return face_batchers[profile_for(endpoint)]
+
+
+if len({PROFILES[profile]["recognition_pack"] for profile in face_batchers}) > 1:
+    print("Warning: inference profiles in use have different recognition models; "
+          "embeddings from /register and /verify will not be comparable")
+
+
+# Detect once per frame and keep everything the later stages need
+def analyze_frame(img, endpoint):
+    return build_frame_analysis(img, get_face_batcher(endpoint)(img))
+
+
+# Optional pool of model worker processes (model_workers > 0); created on first use
+# so that spawned workers importing this module don't start pools of their own
+MODEL_WORKERS = int(os.getenv("model_workers", 0))
+worker_pool = None
+worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    global worker_pool
+    if worker_pool is None:
+        with worker_pool_lock:
+            if worker_pool is None:
+                worker_pool = ModelWorkerPool("face_pipeline:check_frame_worker", num_workers=MODEL_WORKERS,
+                                              acquire_timeout=float(os.getenv("model_worker_timeout", 5)),
+                                              init_path="face_pipeline:warm_up",
+                                              run_timeout=float(os.getenv("model_worker_run_timeout", 30)))
+                atexit.register(worker_pool.close)
+    return worker_pool
+
+
+# Embedding, liveness and head position for one /verify frame, in a worker process if configured
+def run_frame_checks(img):
+    if MODEL_WORKERS > 0:
+        return get_worker_pool().run(img)
+    return check_frame(img, get_face_batcher("verify")(img), profile_for("verify"))
+
+
+# Continuity and head position only, for a frame of an open challenge session
+def run_session_checks(img, continuity_reference):
+    if MODEL_WORKERS > 0:
+        return get_worker_pool().run(img, continuity_reference)
+    return check_session_frame(img, continuity_reference, profile_for("verify"))
+
+
+# Continuity embedding of a verified frame's face, the reference later frames are compared with
+def run_continuity_embedding(img, landmarks):
+    if MODEL_WORKERS > 0:
+        return get_worker_pool().run(img, None, landmarks)
+    return continuity_embedding(img, landmarks)
+
+
+# Challenge sessions (challenge_sessions=true): the first /verify frame of a challenge is
+# fully verified; if it matched and was live, later frames sent with the returned
+# session_id only get the pose and a face-continuity check. A frame that fails continuity
+# ends the session and goes through full verification again.
+challenge_sessions = ChallengeSessions(ttl=int(os.getenv("challenge_session_ttl", 120)),
+                                       max_size=int(os.getenv("challenge_session_max", 10000)))
+CONTINUITY_THRESHOLD = float(os.getenv("challenge_continuity_threshold", 0.6))
+VERIFY_THRESHOLD = 0.5  # Adjust based on performance
+
+
+def opens_challenge_session(frame_result, similarity):
+    return CHALLENGE_SESSIONS and similarity >= VERIFY_THRESHOLD and frame_result["liveness_status"] == "Live"
+
+
+# Session for a fully verified frame, or None when it didn't pass identity and liveness.
+# The continuity model only runs here, for frames that do open a session; if the worker
+# pool is busy the frame stays verified and the client just gets no session.
+def open_challenge_session(email, img, frame_result, similarity):
+    if not opens_challenge_session(frame_result, similarity):
+        return None
+    try:
+        reference = run_continuity_embedding(img, frame_result["landmarks"])
+    except PoolBusy:
+        return None
+    return challenge_sessions.create(email, reference, float(similarity),
+                                     frame_result["liveness_status"], frame_result["liveness_score"])
+
+
 # Function to compute embeddings of captured image
-def compute_embedding(img):
-    faces = face.get(img)
-    if len(faces) > 0:
-        return faces[0].normed_embedding
+def compute_embedding(img, endpoint="identify"):
+    analysis = analyze_frame(img, endpoint)
+    if analysis is not None:
+        return analysis["embedding"]
     return None
 
 
-# # Function to detect head position using MediaPipe
-def detect_head_position(image, face_landmarks, img_w, img_h):
-    face_3d, face_2d = [], []
-    for idx, lm in enumerate(face_landmarks.landmark):
-        if idx in [33, 263, 1, 61, 291, 199]:
-            x, y = int(lm.x * img_w), int(lm.y * img_h)
-            face_2d.append([x, y])
-            face_3d.append([x, y, lm.z])
-
-    face_2d, face_3d = np.array(face_2d, dtype=np.float64), np.array(face_3d, dtype=np.float64)
-    focal_length = 1 * img_w
-    cam_matrix = np.array([[focal_length, 0, img_h / 2],
-                           [0, focal_length, img_w / 2], [0, 0, 1]])
-    dist_matrix = np.zeros((4, 1), dtype=np.float64)
-    success, rot_vec, trans_vec = cv2.solvePnP(face_3d, face_2d, cam_matrix, dist_matrix)
-    rmat, _ = cv2.Rodrigues(rot_vec)
-    angles, _, _, _, _, _ = cv2.RQDecomp3x3(rmat)
-    x, y, z = angles[0] * 360, angles[1] * 360, angles[2] * 360
-    return x, y, z
-
-
-# Function to check whether user performed correct task or not
-def validate_task(image):
-    img_h, img_w, _ = image.shape
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    results = face_mesh.process(rgb_image)
-
-    if results.multi_face_landmarks:
-        for face_landmarks in results.multi_face_landmarks:
-            x, y, z = detect_head_position(image, face_landmarks, img_w, img_h)
-            if y < -9:
-                head_position = "Left"
-            elif y > 9:
-                head_position = "Right"
-            elif x > 15:
-                head_position = "Up"
-            else:
-                head_position = "Front"
-            return head_position
-    return "Unknown"
-
-
-# Function to check for spoofing using DeepFace
-def check_liveness(img):
-    try:
-        result = DeepFace.extract_faces(img_path=img, detector_backend="opencv", enforce_detection=False, align=False,
-                                        anti_spoofing=True)
-        return "Live" if result[0]["antispoof_score"] > 0.5 else "Spoof"
-    except Exception as e:
-        print("Liveness detection error:", e)
-    return "Unknown"
+# Reverse geocoding goes through a grid-cell cache with a pooled session and strict timeout
+geocoder = geocoder_from_env()
+GEOCODE_DEFERRED = os.getenv("geocode_deferred", "false").lower() == "true"
+
+
+# Location to write with a new log. In deferred mode only the cache is consulted and a
+# miss returns None; the log is then written straight away and filled in by fill_location_later
+def location_for_log(latitude, longitude):
+    if GEOCODE_DEFERRED:
+        return geocoder.cached(latitude, longitude)
+    return geocoder.lookup(latitude, longitude)
+
+
+def fill_location_later(log_id, timestamp, latitude, longitude):
+    geocoder.lookup_deferred(latitude, longitude,
+                             lambda location: log_store.update_location(log_id, timestamp, location))
 
 
-def get_location(latitude, longitude):
-    url = f"https://api.bigdatacloud.net/data/reverse-geocode-client?latitude={latitude}&longitude={longitude}&localityLanguage=en"
-    response = requests.get(url)
-    data = response.json()
+# Log writes are queued and flushed in bulk unless audit_log_buffered=false
+AUDIT_LOG_BUFFERED = os.getenv("audit_log_buffered", "true").lower() == "true"
+audit_log = AuditLogWriter(log_store, max_batch=int(os.getenv("audit_log_batch", 500)),
+                           flush_interval=float(os.getenv("audit_log_flush_interval", 1.0)),
+                           max_queue=int(os.getenv("audit_log_max_queue", 10000)),
+                           on_flush=rollups.record_logs) if AUDIT_LOG_BUFFERED else None
+if audit_log is not None:
+    atexit.register(audit_log.close)
+
+
+# Write a log entry. A None location is resolved in the background: the log is written
+# (or queued) straight away as Unknown and patched once the location is known, so a
+# flush() right after always sees it
+def insert_log(log, latitude=None, longitude=None):
+    pending = log.get("location") is None
+    if pending:
+        log["location"] = dict(UNKNOWN_LOCATION)
+    if audit_log is not None:
+        if pending:
+            log["_id"] = ObjectId()  # known before the insert, for the location patch
+        audit_log.write(log)
+        if pending:
+            geocoder.lookup_deferred(latitude, longitude, lambda location: audit_log.amend(
+                log, {"location": location},
+                lambda: log_store.update_location(log["_id"], log["timestamp"], location)))
+        return
+
+    result = log_store.insert_one(log)
+    rollups.record_logs([log])
+    if pending:
+        fill_location_later(result.inserted_id, log["timestamp"], latitude, longitude)
 
-    if "locality" in data:
-        return {
-            "city": data.get('city', 'Unknown'),
-            "state": data.get('principalSubdivision', 'Unknown'),
-            "country": data.get('countryName', 'Unknown')
-        }
-    return {"city": "Unknown", "state": "Unknown", "country": "Unknown"}
 
 @app.route("/log-verification", methods=["POST"])
 def log_verification():
@@ -229,7 +377,6 @@ def log_verification():
     latitude = data.get("latitude")
     time_taken = data.get("time_taken")
     longitude = data.get("longitude")
-    location_data = get_location(latitude, longitude)
     status = data.get("status", "Verified")  # default is "Verified"
     detail = data.get("details", "Logged in Successfully")
 
@@ -237,10 +384,18 @@ def log_verification():
     if not email:
         return jsonify({"status": "error", "message": "Missing email"}), 400
 
-    result = Logs.find_one_and_update(
-        {"email": email},
-        {"$set": {"verification_status": True, "status": status, "detail": detail,
-                  "location": location_data, "timestamp": datetime.datetime.now(), "time_taken": time_taken}})
+    location_data = location_for_log(latitude, longitude) if latitude and longitude else dict(UNKNOWN_LOCATION)
+    # The entry being verified may still be sitting in the audit-log buffer
+    if audit_log is not None:
+        audit_log.flush()
+    update = {"verification_status": True, "status": status, "detail": detail,
+              "location": location_data or dict(UNKNOWN_LOCATION), "timestamp": datetime.datetime.now(),
+              "time_taken": time_taken}
+    result = log_store.find_one_and_update({"email": email}, update)
+    if result:
+        rollups.record_log_update(result, update)
+    if result and location_data is None:
+        fill_location_later(result["_id"], update["timestamp"], latitude, longitude)
     if result:
         return jsonify({"status": "success", "message": "Verified successfully in db."})
     else:
@@ -250,67 +405,63 @@ def log_verification():
 # registartion route
 @app.route("/register", methods=["POST"])
 def register():
-    front_image = request.form.get("frontImage")
-    left_image = request.form.get("leftImage")
-    right_image = request.form.get("rightImage")
+    try:
+        front_image = read_image_field(request, "frontImage")
+        left_image = read_image_field(request, "leftImage")
+        right_image = read_image_field(request, "rightImage")
+    except ImageTooLarge as e:
+        return jsonify({"status": "error", "message": str(e)}), 413
     name = request.form.get("name")
     email = request.form.get("email")
     password = request.form.get("password")
     latitude = request.form.get('latitude')
     longitude = request.form.get('longitude')
 
-    # os.makedirs("images", exist_ok=True)
-    os.makedirs("images", exist_ok=True)
-
-    if latitude and longitude:
-        location_data = get_location(latitude, longitude)
-
     if not all([front_image, left_image, right_image, name, email, password]):
         return jsonify({"status": "error", "message": "Missing required fields"}), 400  # Bad request
 
-    if User.find_one({"email": email}):
-        return jsonify({"status": "error", "message": "User already exists"}), 400
-
-    # Decode and store the front image as a binary blob
-    front_image_data = base64.b64decode(front_image.split(",")[1])
-    front_image_blob = Binary(front_image_data)
+    with metrics.stage("register", "geocode"):
+        location_data = location_for_log(latitude, longitude) if latitude and longitude else {}
 
-    # front_image_url = upload_to_azure_blob(front_image_data, "front.jpeg")
+    with metrics.stage("register", "user_lookup"):
+        existing_user = User.find_one({"email": email}, {"_id": 1})
+    if existing_user:
+        return jsonify({"status": "error", "message": "User already exists"}), 400
 
-    images = [front_image, left_image, right_image]
     embeddings = []
 
-    Timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-
-    for i, img_data in enumerate(images):
-        if i == 0:
-            continue
-
-        img_data = img_data.split(",")[1]
-        filename = f'images/{Timestamp}_{i}.jpeg'
-        with open(filename, "wb") as f:
-            f.write(base64.b64decode(img_data))
+    # Pose images are decoded in memory, at reduced scale when much larger than the detector input
+    with metrics.stage("register", "decode"):
+        pose_images = [decode_frame(left_image), decode_frame(right_image)]
 
-        img = cv2.imread(filename)
-        faces = face.get(img)
-
-        if len(faces) == 0:
+    # All pose images go through the batcher together
+    with metrics.stage("register", "detect_and_embed"):
+        detections = get_face_batcher("register").map(pose_images)
+    for i, detected in enumerate(detections, start=1):
+        if detected is None:
             return jsonify({"status": "error", "message": f"No face detected in image {i + 1}"}), 400
 
-        embeddings.append(faces[0].embedding)
+        embeddings.append(detected.embedding)
 
-    avg_embedding = np.mean(embeddings, axis=0).tolist()
+    avg_embedding = np.mean(embeddings, axis=0)
 
-    User.insert_one({
-        "name": name,
-        "email": email,
-        "password": password,
-        "user_image": front_image_blob,
-        "face_embedding": avg_embedding,
-        "timestamp": datetime.datetime.now()
-    })
+    with metrics.stage("register", "insert_user"):
+        User.insert_one({
+            "name": name,
+            "email": email,
+            "password": password,
+            "user_image_key": user_image_key(email),
+            "user_image_status": "pending",
+            "face_embedding": encode_embedding(avg_embedding, EMBEDDING_STORAGE_DTYPE),
+            "timestamp": datetime.datetime.now()
+        })
+    store_user_image(image_uploader, User, email, front_image)
+    embedding_cache.put(email, normalize_embedding(avg_embedding))
+    rollups.record_registration(datetime.datetime.now())
+    if gallery_synced_at is not None:
+        gallery.add(email, avg_embedding)
 
-    Logs.insert_one({
+    insert_log({
         "email": email,
         "name": name,
         "status": "In Process",
@@ -319,7 +470,7 @@ def register():
         "detail": "Registered",
         "location": location_data,
         "timestamp": datetime.datetime.now()
-    })
+    }, latitude, longitude)
 
     return jsonify({"status": "success"})
 
@@ -328,57 +479,97 @@ def register():
 def login():
     data = request.json
     email = data.get("email")
-    name = User.find_one({"email":email})['name']
     password = data.get("password")
     latitude = data.get("latitude")
     longitude = data.get("longitude")
-    location_data = get_location(latitude, longitude) if latitude and longitude else {}
+    with metrics.stage("login", "geocode"):
+        location_data = location_for_log(latitude, longitude) if latitude and longitude else {}
     if not email or not password:
         return jsonify({"status": "error", "message": "Missing email or password"}), 400
 
-    user = User.find_one({"email": email})
+    # Only the fields login needs; never the face image or embedding
+    with metrics.stage("login", "user_lookup"):
+        user = User.find_one({"email": email}, {"name": 1, "password": 1, "_id": 0})
+    name = user["name"] if user else None
 
     if not user:
-        Logs.insert_one({"email": email, "name": name, "status": "Rejected", "login_status": False, "verification_status": False,
-                         "detail": "User not found", "location": location_data, "timestamp": datetime.datetime.now()})
+        insert_log({"email": email, "name": name, "status": "Rejected", "login_status": False, "verification_status": False,
+                   "detail": "User not found", "location": location_data, "timestamp": datetime.datetime.now()}, latitude, longitude)
         return jsonify({"status": "error", "message": "User not found"}), 404
 
     if user["password"] != password:
-        Logs.insert_one({"email": email, "name": name, "status": "Rejected", "login_status": False, "verification_status": False,
-                         "detail": "Invalid password", "location": location_data, "timestamp": datetime.datetime.now()})
+        insert_log({"email": email, "name": name, "status": "Rejected", "login_status": False, "verification_status": False,
+                   "detail": "Invalid password", "location": location_data, "timestamp": datetime.datetime.now()}, latitude, longitude)
         return jsonify({"status": "error", "message": "Invalid password"}), 401
 
-    is_admin = Admins.find_one({"email": email}) is not None
+    with metrics.stage("login", "admin_lookup"):
+        is_admin = Admins.find_one({"email": email}, {"_id": 1}) is not None
     if is_admin:
-        Logs.insert_one(
+        insert_log(
             {"email": email, "name": name, "status": "Admin Login", "login_status": True, "verification_status": False,
              "detail": "Admin Login", "location": location_data,
-             "timestamp": datetime.datetime.now()})
+             "timestamp": datetime.datetime.now()}, latitude, longitude)
         return jsonify(
             {"status": "success", "message": "Admin Login successful", "is_admin": is_admin})
 
-    Logs.insert_one({"email": email, "name": name, "status": "In Process", "login_status": True, "verification_status": False,
-                     "detail": "Passed login, awaiting verification", "location": location_data, "timestamp": datetime.datetime.now()})
+    insert_log({"email": email, "name": name, "status": "In Process", "login_status": True, "verification_status": False,
+               "detail": "Passed login, awaiting verification", "location": location_data, "timestamp": datetime.datetime.now()}, latitude, longitude)
     return jsonify({"status": "success", "message": "Login successful, proceed to verification", "is_admin": is_admin})
 
 
 @app.route('/active-users', methods=['GET'])
+@cached_json()
 def active_users():
     data = get_active_users_by_day()
     return jsonify(data)
 
 
+AUTH_RATE_STATUSES = ["Verified", "Rejected"]
+
+
+def auth_rates_summary(totals):
+    return {
+        "success": totals["Verified"],
+        "failure": totals["Rejected"]
+    }
+
+
 @app.route('/auth-rates', methods=['GET'])
+@cached_json()
 def get_auth_rates():
-    success_count = Logs.count_documents({"status": "Verified"})
-    failure_count = Logs.count_documents({"status": "Rejected"})
+    return auth_rates_summary(rollups.status_totals(AUTH_RATE_STATUSES))
 
-    return {
-        "success": success_count,
-        "failure": failure_count
+
+CHALLENGE_FIELDS = [
+    "correct_Up", "correct_Left", "correct_Right", "correct_Front",
+    "failed_Up", "failed_Left", "failed_Right", "failed_Front"
+]
+
+
+def challenge_result_update(selected_task, correct):
+    field = ("correct_" if correct else "failed_") + selected_task
+    return field, {
+        "$inc": {field: 1},
+        "$setOnInsert": {name: 0 for name in CHALLENGE_FIELDS if name != field}
     }
 
 
+# Function to update per-user challenge counters, returns the task validity string.
+# One upsert per request: the counter being bumped is $inc'ed and the others are zeroed on insert.
+# The per-day global counters in ChallengeStats are written unacknowledged, so they add no wait.
+def record_challenge_result(email, selected_task, correct):
+    task_validity = "Correct" if correct else "Incorrect"
+    field, user_update = challenge_result_update(selected_task, correct)
+
+    ChallengeLogs.update_one({"email": email}, user_update, upsert=True)
+    ChallengeStatsFast.update_one(
+        {"_id": datetime.datetime.now().strftime("%Y-%m-%d")},
+        {"$inc": {field: 1}},
+        upsert=True
+    )
+    return task_validity
+
+
 # actual verification route
 @app.route('/verify', methods=['POST'])
 def verify():
@@ -390,255 +581,488 @@ def verify():
 
         email = request.form.get("email")
         selected_task = request.form.get("task")
-        img_base64 = request.form.get("image")
-        img_base64 = img_base64.split(",")[1]
+        with metrics.stage("verify", "read_upload"):
+            image_data = read_image_field(request, "image")
 
         print(email, selected_task)
 
-        if not email or not img_base64:
+        if not email or not image_data:
             return jsonify({"error": "Missing email or image"}), 400
 
         # Decode and process the image
-        img = decode_image(img_base64)
+        with metrics.stage("verify", "decode"):
+            img = decode_frame(image_data)
         if img is None:
             return jsonify({"error": "Invalid image format"}), 400
 
+        # A frame of an open challenge session: pose plus continuity with the session's first frame
+        session_id = request.form.get("session_id")
+        session = challenge_sessions.get(session_id, email) if session_id and CHALLENGE_SESSIONS else None
+        if session is not None:
+            try:
+                with metrics.stage("verify", "session_checks"):
+                    session_result = run_session_checks(img, session["continuity_embedding"])
+            except PoolBusy:
+                return jsonify({"error": "Server busy, try again"}), 503
+            if session_result is None:
+                return jsonify({"error": "No face detected in the captured image"}), 400
+            if session_result["continuity"] >= CONTINUITY_THRESHOLD:
+                challenge_sessions.record_reuse(session)
+                task_result = session_result["task_result"]
+                print("Detected task", task_result)
+                with metrics.stage("verify", "record_challenge"):
+                    task_validity = record_challenge_result(email, selected_task, task_result == selected_task)
+                return jsonify({
+                    "face_match": "Matched",
+                    "similarity": round(session["similarity"], 2),
+                    "liveness_status": session["liveness_status"],
+                    "liveness_score": session["liveness_score"],
+                    "task_validity": task_validity,
+                    "session_id": session_id
+                })
+            # Someone else may be in front of the camera now: verify this frame from scratch
+            challenge_sessions.discard(session_id, continuity_failed=True)
+
         # Get stored reference embedding
-        reference_embedding = get_reference_embedding(email)
+        with metrics.stage("verify", "reference_embedding"):
+            reference_embedding = get_reference_embedding(email)
         if reference_embedding is None:
             return jsonify({"error": "Reference embedding not found for this user"}), 404
 
-        # Compute embeddings for the captured image
-        captured_embedding = compute_embedding(img)
-        if captured_embedding is None:
+        # Detect once and share the result with recognition, anti-spoofing and pose
+        try:
+            with metrics.stage("verify", "frame_checks"):
+                frame_result = run_frame_checks(img)
+        except PoolBusy:
+            return jsonify({"error": "Server busy, try again"}), 503
+        if frame_result is None:
             return jsonify({"error": "No face detected in the captured image"}), 400
+        captured_embedding = frame_result["embedding"]
 
-        # Compute similarity
-        def normalize(embedding):
-            return embedding / np.linalg.norm(embedding)
-
-        similarity = np.dot(normalize(captured_embedding), normalize(reference_embedding))
+        # Compute similarity (reference embedding is already normalized float32)
+        similarity = np.dot(normalize_embedding(captured_embedding), reference_embedding)
         print(similarity)
-        threshold = 0.5  # Adjust based on performance
 
         # Check face match
-        face_match = "Matched" if similarity >= threshold else "Not Matched"
+        face_match = "Matched" if similarity >= VERIFY_THRESHOLD else "Not Matched"
 
         # Check liveness
-        liveness_status = check_liveness(img)
+        liveness_status = frame_result["liveness_status"]
 
         # Task validation
-        task_validity = ""
-        task_result = validate_task(img)
+        task_result = frame_result["task_result"]
         print("Detected task", task_result)
 
-        ChallengeLogs.update_one(
-            {"email": email},
-            {
-                "$setOnInsert": {
-                    "correct_Up": 0, "correct_Left": 0, "correct_Right": 0, "correct_Front": 0,
-                    "failed_Up": 0, "failed_Left": 0, "failed_Right": 0, "failed_Front": 0
-                }
-            },
-            upsert=True
-        )
-
-        if task_result == selected_task:
-            task_validity = "Correct"
-            correct_task = "correct_" + selected_task
-            ChallengeLogs.update_one(
-                {"email": email},
-                {"$inc": {correct_task: 1}}
-            )
-        else:
-            task_validity = "Incorrect"
-            failed_task = "failed_" + selected_task
-            ChallengeLogs.update_one(
-                {"email": email},
-                {"$inc": {failed_task: 1}}
-            )
+        with metrics.stage("verify", "record_challenge"):
+            task_validity = record_challenge_result(email, selected_task, task_result == selected_task)
 
         # Response
         return jsonify({
             "face_match": face_match,
             "similarity": round(float(similarity), 2),
             "liveness_status": liveness_status,
-            "task_validity": task_validity
+            "liveness_score": frame_result.get("liveness_score"),
+            "task_validity": task_validity,
+            "session_id": open_challenge_session(email, img, frame_result, similarity)
         })
 
+    except ImageTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except HTTPException:
+        raise  # e.g. RequestEntityTooLarge (413) from a body over MAX_CONTENT_LENGTH
     except Exception as e:
         # import traceback
         # print(traceback.format_exc())  # Print the full error stack trace
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/get-logs", methods=["GET"])
-def get_logs():
-    Logs.create_index([("timestamp", -1)])
-
-    logs = list(Logs.find().sort("timestamp", -1))  # Fetch logs in descending order
-    #logs = list(Logs.find())
-    for log in logs:
-        log["_id"] = str(log["_id"])  # Convert ObjectId to string (for frontend)
-    return jsonify(logs)
+# Streaming challenge verification. The request body is a chunked stream of frames, one
+# base64 image or data URL per line. Identity and liveness are checked on the first frame
+# with a face; every frame then goes through a FaceMesh tracker, and we stop reading as
+# soon as the requested pose has been held for hold_frames consecutive frames. Every
+# stream_continuity_interval frames the face is compared with the verified one, so the
+# pose can't be performed by someone else once the first frame has passed.
+STREAM_MAX_HOLD_FRAMES = int(os.getenv("stream_max_hold_frames", 30))
+STREAM_MAX_FRAMES = int(os.getenv("stream_max_frames", 300))
+STREAM_CONTINUITY_INTERVAL = int(os.getenv("stream_continuity_interval", 10))
 
 
-@app.route('/average-session-duration', methods=['GET'])
-def get_avg_session_duration():
+@app.route('/verify-stream', methods=['POST'])
+def verify_stream():
+    email = request.args.get("email")
+    selected_task = request.args.get("task")
     try:
-        today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        start_date = today - datetime.timedelta(days=6)  # Last 7 days including today
-
-        # Generate all dates in range
-        all_dates = {(start_date + datetime.timedelta(days=i)).strftime("%Y-%m-%d"): 0 for i in range(7)}
-
-        # Aggregate logs to check for 'In Process' status and compute average session duration
-        pipeline = [
-            {"$match": {"timestamp": {"$gte": start_date}}},
-            {"$group": {
-                "_id": {
-                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-                    "status": "$status"
-                },
-                "all_time_taken": {"$push": "$time_taken"}
-            }},
-            {"$group": {
-                "_id": "$_id.date",
-                "statuses": {"$push": {"status": "$_id.status", "time_taken": "$all_time_taken"}}
-            }},
-            {"$sort": {"_id": 1}}
-        ]
+        hold_frames = int(request.args.get("hold_frames", 5))
+        max_frames = int(request.args.get("max_frames", 120))
+    except ValueError:
+        return jsonify({"error": "hold_frames and max_frames must be integers"}), 400
+
+    if not email or not selected_task:
+        return jsonify({"error": "Missing email or task"}), 400
+    if not 1 <= hold_frames <= STREAM_MAX_HOLD_FRAMES or not hold_frames <= max_frames <= STREAM_MAX_FRAMES:
+        return jsonify({"error": f"hold_frames must be 1-{STREAM_MAX_HOLD_FRAMES} and max_frames "
+                                 f"hold_frames-{STREAM_MAX_FRAMES}"}), 400
+
+    reference_embedding = get_reference_embedding(email)
+    if reference_embedding is None:
+        return jsonify({"error": "Reference embedding not found for this user"}), 404
+
+    tracker = PoseTracker(selected_task, hold_frames=hold_frames)
+    frame_result = continuity_reference = None
+    continuity = None
+    try:
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                img = decode_image(line)
+            except ImageTooLarge as e:
+                return jsonify({"error": str(e)}), 413
+            if img is None:
+                continue
+
+            try:
+                if frame_result is None:
+                    frame_result = run_frame_checks(img)
+                    if frame_result is not None:
+                        continuity_reference = run_continuity_embedding(img, frame_result["landmarks"])
+                elif tracker.frames % STREAM_CONTINUITY_INTERVAL == 0:
+                    session_result = run_session_checks(img, continuity_reference)
+                    if session_result is not None:
+                        continuity = session_result["continuity"]
+                        if continuity < CONTINUITY_THRESHOLD:
+                            break
+            except PoolBusy:
+                return jsonify({"error": "Server busy, try again"}), 503
+
+            tracker.update(img)
+            if tracker.done or tracker.frames >= max_frames:
+                break
+    finally:
+        tracker.close()
+
+    if frame_result is None:
+        return jsonify({"error": "No face detected in the streamed frames"}), 400
+
+    similarity = np.dot(normalize_embedding(frame_result["embedding"]), reference_embedding)
+    same_face = continuity is None or continuity >= CONTINUITY_THRESHOLD
+    task_validity = record_challenge_result(email, selected_task, tracker.done and same_face)
+
+    return jsonify({
+        "face_match": "Matched" if similarity >= VERIFY_THRESHOLD and same_face else "Not Matched",
+        "similarity": round(float(similarity), 2),
+        "continuity": round(continuity, 2) if continuity is not None else None,
+        "liveness_status": frame_result["liveness_status"],
+        "liveness_score": frame_result.get("liveness_score"),
+        "task_validity": task_validity,
+        "frames_processed": tracker.frames,
+        "held_frames": tracker.held
+    })
 
-        results = list(Logs.aggregate(pipeline))
 
-        for entry in results:
-            date = entry["_id"]
-            session_times = []
-            in_process_found = False
+IDENTIFY_MAX_K = 50
 
-            for status_entry in entry["statuses"]:
-                if status_entry["status"] == "In Process":
-                    in_process_found = True
-                session_times.extend([time for time in status_entry["time_taken"] if time is not None])
 
-            if in_process_found and session_times:
-                session_times[0] = 0
+# 1:N identification route, returns the top-k enrolled users for one image (k is clamped to 1-50)
+@app.route('/identify', methods=['POST'])
+def identify():
+    try:
+        image_data = read_image_field(request, "image")
+        if not image_data:
+            return jsonify({"error": "Missing image"}), 400
+        try:
+            k = max(1, min(int(request.form.get("k", 5)), IDENTIFY_MAX_K))
+        except ValueError:
+            return jsonify({"error": "k must be an integer"}), 400
+
+        img = decode_frame(image_data)
+        if img is None:
+            return jsonify({"error": "Invalid image format"}), 400
 
-            avg_session_duration = sum(session_times) / len(session_times) if session_times else 0
-            all_dates[date] = round(avg_session_duration, 2)
+        captured_embedding = compute_embedding(img)
+        if captured_embedding is None:
+            return jsonify({"error": "No face detected in the captured image"}), 400
 
-        last_7_days_data = [{"date": date, "average_session_duration": avg_duration} for date, avg_duration in all_dates.items()]
+        matches = get_gallery().search(captured_embedding, k=k)
+        return jsonify({
+            "matches": [{"email": email, "similarity": round(score, 2), "face_match": "Matched" if score >= VERIFY_THRESHOLD else "Not Matched"}
+                        for email, score in matches]
+        })
 
-        # ----------------- Overall Avg (Last 7 Days Only) -----------------
-        last_7_days_pipeline = [
-            {"$match": {"timestamp": {"$gte": start_date}}},
-            {"$group": {
-                "_id": None,
-                "all_time_taken": {"$push": "$time_taken"}
-            }}
-        ]
-        last_7_days_result = list(Logs.aggregate(last_7_days_pipeline))
+    except ImageTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except HTTPException:
+        raise  # e.g. RequestEntityTooLarge (413) from a body over MAX_CONTENT_LENGTH
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        if last_7_days_result and last_7_days_result[0]["all_time_taken"]:
-            valid_times = [time for time in last_7_days_result[0]["all_time_taken"] if time is not None]
-            overall_avg_session_duration = round(sum(valid_times) / len(valid_times), 2) if valid_times else 0
-        else:
-            overall_avg_session_duration = 0
-
-        # ----------------- Previous Week Avg -----------------
-        previous_week_start = today - datetime.timedelta(days=13)
-        previous_week_end = today - datetime.timedelta(days=7)
-
-        prev_week_pipeline = [
-            {"$match": {"timestamp": {"$gte": previous_week_start, "$lte": previous_week_end}}},
-            {"$group": {
-                "_id": None,
-                "all_time_taken": {"$push": "$time_taken"}
-            }}
-        ]
-        prev_week_results = list(Logs.aggregate(prev_week_pipeline))
 
-        if prev_week_results and prev_week_results[0]["all_time_taken"]:
-            valid_prev_times = [time for time in prev_week_results[0]["all_time_taken"] if time is not None]
-            prev_week_avg = round(sum(valid_prev_times) / len(valid_prev_times), 2) if valid_prev_times else 0
+# Load and warm every model; in worker-pool mode the workers warm themselves at spawn
+def warm_up_models():
+    try:
+        if MODEL_WORKERS > 0:
+            get_worker_pool()
         else:
-            prev_week_avg = 0
+            warm_up()
+        print("Models warm:", model_status()["load_times"])
+    except Exception as e:
+        print("Model warm-up error:", e)
 
-        # ----------------- Percentage Change & Trend -----------------
-        if prev_week_avg > 0:
-            percentage_change = round(((overall_avg_session_duration - prev_week_avg) / prev_week_avg) * 100, 2)
-        else:
-            percentage_change = 0
 
-        trend = "up" if percentage_change > 0 else "down" if percentage_change < 0 else "neutral"
+# Readiness probe: 200 once the models are loaded and warm, 503 before that
+@app.route("/ready", methods=["GET"])
+def ready():
+    status = model_status()
+    if MODEL_WORKERS > 0:
+        status["warm"] = worker_pool is not None
+    return jsonify(status), 200 if status["warm"] else 503
 
-        return jsonify({
-            "success": True,
-            "last_7_days": last_7_days_data,
-            "overall_avg_session_duration": overall_avg_session_duration,
-            "percentage_change": percentage_change,
-            "trend": trend
-        })
+
+@app.route("/audit-log-stats", methods=["GET"])
+def audit_log_stats():
+    if audit_log is None:
+        return jsonify({"buffered": False})
+    return jsonify(audit_log.stats())
+
+
+@app.route("/geocoder-stats", methods=["GET"])
+def geocoder_stats():
+    return jsonify(geocoder.stats())
+
+
+@app.route("/batcher-stats", methods=["GET"])
+def batcher_stats():
+    return jsonify({profile: batcher.stats() for profile, batcher in face_batchers.items()})
+
+
+@app.route("/embedding-cache-stats", methods=["GET"])
+def embedding_cache_stats():
+    return jsonify(embedding_cache.stats())
+
+
+@app.route("/challenge-session-stats", methods=["GET"])
+def challenge_session_stats():
+    return jsonify(challenge_sessions.stats())
+
+
+# Values owned by other components, read at scrape time
+def collect_component_metrics():
+    cache = embedding_cache.stats()
+    yield "embedding_cache_hits_total", "counter", "Reference embedding cache hits", {}, cache["hits"]
+    yield "embedding_cache_misses_total", "counter", "Reference embedding cache misses", {}, cache["misses"]
+    yield "embedding_cache_hit_rate", "gauge", "Reference embedding cache hit rate", {}, cache["hit_rate"]
+    yield "embedding_cache_size", "gauge", "Cached reference embeddings", {}, cache["size"]
+
+    sessions = challenge_sessions.stats()
+    yield "challenge_sessions_active", "gauge", "Open challenge sessions", {}, sessions["size"]
+    yield "challenge_sessions_created_total", "counter", "Challenge sessions opened", {}, sessions["created"]
+    yield "challenge_session_frames_reused_total", "counter", "Frames answered from a challenge session", {}, \
+        sessions["reused"]
+    yield "challenge_session_continuity_failures_total", "counter", "Session frames that failed continuity", {}, \
+        sessions["continuity_failures"]
+
+    geocoding = geocoder.stats()
+    lookups = geocoding["hits"] + geocoding["misses"]
+    yield "geocoder_cache_hits_total", "counter", "Geocoder cache hits", {}, geocoding["hits"]
+    yield "geocoder_cache_misses_total", "counter", "Geocoder cache misses", {}, geocoding["misses"]
+    yield "geocoder_errors_total", "counter", "Failed reverse geocoding calls", {}, geocoding["errors"]
+    yield ("geocoder_cache_hit_rate", "gauge", "Geocoder cache hit rate", {},
+           round(geocoding["hits"] / lookups, 4) if lookups else 0)
+
+    for profile, batcher in face_batchers.items():
+        yield "batcher_queue_depth", "gauge", "Frames waiting for a detection batch", {"profile": profile}, \
+            batcher.stats()["queue_depth"]
+    if audit_log is not None:
+        log_stats = audit_log.stats()
+        yield "audit_log_queue_depth", "gauge", "Log records waiting to be flushed", {}, log_stats["queue_depth"]
+        yield "audit_log_written_total", "counter", "Log records flushed", {}, log_stats["written"]
+        yield "audit_log_failed_total", "counter", "Log records that failed to flush", {}, log_stats["failed"]
+    uploads = image_uploader.stats()
+    yield "image_uploads_total", "counter", "Face images uploaded", {}, uploads["uploaded"]
+    yield "image_upload_failures_total", "counter", "Face image uploads that failed", {}, uploads["failed"]
+
+
+metrics.add_collector(collect_component_metrics)
+
+
+# Prometheus scrape endpoint. Model timings recorded inside worker processes
+# (model_workers > 0) stay in those processes; frame_checks covers them here.
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# On-demand sampling profiler, only when profiler_enabled=true. POST /profiler/start,
+# then POST /profiler/stop returns the collapsed stacks sampled in between.
+PROFILER_ENABLED = os.getenv("profiler_enabled", "false").lower() == "true"
+profiler = SamplingProfiler(interval=float(os.getenv("profiler_interval_ms", 10)) / 1000)
+
+
+@app.route("/profiler/<action>", methods=["POST"])
+def profiler_control(action):
+    if not PROFILER_ENABLED:
+        return jsonify({"error": "Profiler disabled"}), 404
+    if action == "start":
+        return jsonify({"started": profiler.start(), "interval_ms": profiler.interval * 1000})
+    if action == "stop":
+        return Response(profiler.stop(), mimetype="text/plain")
+    return jsonify({"error": "Unknown action"}), 400
+
+
+LOG_PAGE_SIZE = int(os.getenv("log_page_size", 100))
+LOG_MAX_PAGE_SIZE = int(os.getenv("log_max_page_size", 1000))
+
+
+# Logs, newest first. Keyset-paginated on (timestamp, _id): the response is still a JSON
+# array, and the cursor for the next page is returned in the X-Next-Cursor header.
+# ?fields=a,b projects, ?format=ndjson streams every matching log straight from the cursor.
+@app.route("/get-logs", methods=["GET"])
+def get_logs():
+    try:
+        query, start, end = build_log_query(request.args)
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        return jsonify({"error": "Invalid cursor, date or limit"}), 400
+    if limit is not None:
+        limit = max(1, min(limit, LOG_MAX_PAGE_SIZE))
+
+    projection = None
+    if request.args.get("fields"):
+        projection = {field: 1 for field in request.args["fields"].split(",")}
+        projection["timestamp"] = 1
+
+    if request.args.get("format") == "ndjson":
+        # Without a limit every matching log is streamed, one batch in memory at a time
+        logs_cursor = log_store.find(query, projection, start, end, limit=limit or 0, batch_size=LOG_PAGE_SIZE)
+
+        def generate():
+            for log in logs_cursor:
+                log["_id"] = str(log["_id"])
+                yield app.json.dumps(log) + "\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    limit = limit or LOG_PAGE_SIZE
+    logs = list(log_store.find(query, projection, start, end, limit=limit, batch_size=limit))
+    response = jsonify([dict(log, _id=str(log["_id"])) for log in logs])  # ObjectId as string (for frontend)
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encode_log_cursor(logs[-1])
+    return response
+
+
+def session_duration_ranges(today):
+    return {
+        "this_week": (today - datetime.timedelta(days=6), today + datetime.timedelta(days=1)),  # Last 7 days including today
+        "previous_week": (today - datetime.timedelta(days=13), today - datetime.timedelta(days=6))
+    }
+
+
+def session_duration_summary(today, days, previous_days):
+    start_date = today - datetime.timedelta(days=6)
+
+    def average(docs):
+        total = sum(doc.get("time_taken_sum", 0) for doc in docs)
+        count = sum(doc.get("time_taken_count", 0) for doc in docs)
+        return round(total / count, 2) if count else 0
+
+    last_7_days_data = []
+    for i in range(7):
+        date = (start_date + datetime.timedelta(days=i)).strftime("%Y-%m-%d")
+        last_7_days_data.append({"date": date, "average_session_duration": average([days.get(date, {})])})
+
+    # ----------------- Overall Avg (Last 7 Days Only) -----------------
+    overall_avg_session_duration = average(days.values())
+
+    # ----------------- Previous Week Avg -----------------
+    prev_week_avg = average(previous_days.values())
+
+    # ----------------- Percentage Change & Trend -----------------
+    if prev_week_avg > 0:
+        percentage_change = round(((overall_avg_session_duration - prev_week_avg) / prev_week_avg) * 100, 2)
+    else:
+        percentage_change = 0
+
+    trend = "up" if percentage_change > 0 else "down" if percentage_change < 0 else "neutral"
+
+    return {
+        "success": True,
+        "last_7_days": last_7_days_data,
+        "overall_avg_session_duration": overall_avg_session_duration,
+        "percentage_change": percentage_change,
+        "trend": trend
+    }
+
+
+@app.route('/average-session-duration', methods=['GET'])
+@cached_json()
+def get_avg_session_duration():
+    try:
+        today = start_of_today()
+        # Per-day time_taken sums and counts from the DailyRollups collection
+        ranges = session_duration_ranges(today)
+        return jsonify(session_duration_summary(today, rollups.days(*ranges["this_week"]),
+                                                rollups.days(*ranges["previous_week"])))
 
     except Exception as e:
         print("Error fetching session duration:", str(e))
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route('/user-stats', methods=['GET'])
-def get_user_stats():
-    try:
-        now = datetime.datetime.now()
-        start_of_this_week = now - datetime.timedelta(days=now.weekday())  # Monday 00:00 of this week
-        start_of_last_week = start_of_this_week - datetime.timedelta(days=7)
-        end_of_last_week = start_of_this_week - datetime.timedelta(seconds=1)
-
-        # Total users
-        total_users = User.count_documents({})
-        print(f"Total users: {total_users}")
-
-        # New users this week
-        new_users_this_week = User.count_documents({
-            "timestamp": {"$gte": start_of_this_week}
-        })
-        print(f"New users this week: {new_users_this_week}")
+# From Monday 00:00 of last week up to the end of today
+def user_stats_range(today):
+    start_of_this_week = today - datetime.timedelta(days=today.weekday())
+    return start_of_this_week - datetime.timedelta(days=7), today + datetime.timedelta(days=1)
 
-        # New users last week
-        new_users_last_week = User.count_documents({
-            "timestamp": {"$gte": start_of_last_week, "$lte": end_of_last_week}
-        })
-        print(f"New users last week: {new_users_last_week}")
 
-        # Total users till end of last week
-        total_users_last_week = User.count_documents({
-            "timestamp": {"$lte": end_of_last_week}
-        })
-        print(f"Total users till end of last week: {total_users_last_week}")
+def user_stats_summary(today, total_users, days):
+    start_of_this_week = today - datetime.timedelta(days=today.weekday())  # Monday 00:00 of this week
+    new_users = {date: doc.get("new_users", 0) for date, doc in days.items()}
+    this_week_start = start_of_this_week.strftime("%Y-%m-%d")
 
-        # Percentage change in total users
-        total_change = total_users - total_users_last_week
-        percent_total_change = (total_change / total_users_last_week * 100) if total_users_last_week else 0
-        total_change_str = f"{percent_total_change:+.2f}%"
-        total_trend = "up" if percent_total_change > 0 else "down" if percent_total_change < 0 else "neutral"
+    # New users this week
+    new_users_this_week = sum(count for date, count in new_users.items() if date >= this_week_start)
 
-        # Percentage change in new users
-        new_user_change = new_users_this_week - new_users_last_week
-        percent_new_user_change = (new_user_change / new_users_last_week * 100) if new_users_last_week else 0
-        new_user_change_str = f"{percent_new_user_change:+.2f}%"
-        new_user_trend = "up" if percent_new_user_change > 0 else "down" if percent_new_user_change < 0 else "neutral"
+    # New users last week
+    new_users_last_week = sum(count for date, count in new_users.items() if date < this_week_start)
 
-        return jsonify({
-            "total_users": total_users,
-            "total_users_change": total_change_str,
-            "total_users_trend": total_trend,
-            "new_users_this_week": new_users_this_week,
-            "new_users_change": new_user_change_str,
-            "new_users_trend": new_user_trend
-        })
+    # Total users till end of last week
+    total_users_last_week = total_users - new_users_this_week
+
+    # Percentage change in total users
+    total_change = total_users - total_users_last_week
+    percent_total_change = (total_change / total_users_last_week * 100) if total_users_last_week else 0
+    total_change_str = f"{percent_total_change:+.2f}%"
+    total_trend = "up" if percent_total_change > 0 else "down" if percent_total_change < 0 else "neutral"
+
+    # Percentage change in new users
+    new_user_change = new_users_this_week - new_users_last_week
+    percent_new_user_change = (new_user_change / new_users_last_week * 100) if new_users_last_week else 0
+    new_user_change_str = f"{percent_new_user_change:+.2f}%"
+    new_user_trend = "up" if percent_new_user_change > 0 else "down" if percent_new_user_change < 0 else "neutral"
+
+    return {
+        "total_users": total_users,
+        "total_users_change": total_change_str,
+        "total_users_trend": total_trend,
+        "new_users_this_week": new_users_this_week,
+        "new_users_change": new_user_change_str,
+        "new_users_trend": new_user_trend
+    }
+
+
+@app.route('/user-stats', methods=['GET'])
+@cached_json()
+def get_user_stats():
+    try:
+        today = start_of_today()
+        # Total users, and new users per day from the DailyRollups collection
+        return jsonify(user_stats_summary(today, User.estimated_document_count(),
+                                          rollups.days(*user_stats_range(today))))
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+
 @app.route('/get-failed-tasks', methods=["GET"])
 def get_failed_tasks():
     try:
@@ -647,36 +1071,58 @@ def get_failed_tasks():
             "failed_Up", "failed_Down", "failed_Left", "failed_Right", "failed_Front"
         ]
 
-        counts = {}
-        for field in fields:
-            counts[field] = ChallengeLogs.count_documents({field: {"$gt": 0}})
+        # Number of users with a non-zero count per field, in one aggregation
+        pipeline = [{"$group": dict(
+            {"_id": None},
+            **{field: {"$sum": {"$cond": [{"$gt": ["$" + field, 0]}, 1, 0]}} for field in fields}
+        )}]
+        result = next(ChallengeLogs.aggregate(pipeline), {})
+        counts = {field: result.get(field, 0) for field in fields}
 
         return jsonify(counts), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get-top-rejected-users', methods=["GET"])
-def get_top_rejected_users():
+# Per-pose challenge attempts per day, for dashboard charts
+@app.route('/challenge-stats-daily', methods=["GET"])
+def get_challenge_stats_daily():
     try:
-        # Fetch logs with status: Rejected
-        rejected_users = list(Logs.find({"status": "Rejected"}).sort("timestamp", -1))
+        try:
+            days = max(1, min(int(request.args.get("days", 7)), 366))
+        except ValueError:
+            return jsonify({"error": "days must be an integer"}), 400
+        today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        dates = [(today - datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days - 1, -1, -1)]
 
-        # Count occurrences of each user
-        user_counts = defaultdict(int)
-        for log in rejected_users:
-            user_counts[log["email"]] += 1
+        stats = {doc["_id"]: doc for doc in ChallengeStats.find({"_id": {"$gte": dates[0]}})}
+        return jsonify([
+            dict({"date": date}, **{field: stats.get(date, {}).get(field, 0) for field in CHALLENGE_FIELDS})
+            for date in dates
+        ])
 
-        # Sort users by count and get top 4
-        sorted_users = sorted(user_counts.items(), key=lambda x: x[1], reverse=True)[:4]
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Prepare final result
-        top_rejected_users = [{"email": email, "count": count} for email, count in sorted_users]
+@app.route('/get-top-rejected-users', methods=["GET"])
+def get_top_rejected_users():
+    try:
+        # Count rejected logs per user and keep the top 4, all on the server.
+        # ?days=N only counts the last N days (and only reads those months' buckets).
+        start = None
+        if request.args.get("days"):
+            start = datetime.datetime.now() - datetime.timedelta(days=int(request.args["days"]))
+        top_rejected_users = [{"email": doc["_id"], "count": doc["count"]}
+                              for doc in log_store.aggregate(top_rejected_pipeline(start), start)]
 
         return jsonify(top_rejected_users)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+if os.getenv("warm_up_on_start", "true").lower() == "true" and __name__ != "__mp_main__":
+    threading.Thread(target=warm_up_models, daemon=True).start()
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,409 @@
+import asyncio
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+import httpx
+from a2wsgi import WSGIMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.write_concern import WriteConcern
+from quart import Quart, request, jsonify, g
+from quart_cors import cors
+from werkzeug.exceptions import HTTPException
+
+import api
+from embedding_codec import encode_embedding, decode_embedding
+from image_store import store_user_image, user_image_key
+from ingest import read_image_field, decode_frame, ImageTooLarge
+from metrics import registry as metrics
+from response_cache import async_cached_json
+from rollups import AsyncRollups
+from log_store import AsyncLogStore, log_store_from_env
+from worker_pool import PoolBusy
+
+# Async serving mode: uvicorn asgi:application (or python asgi.py).
+# /login, /register, /verify and the dashboard GETs are served natively on the event loop:
+# Mongo goes through Motor, geocoding through an httpx.AsyncClient, and model inference
+# through a bounded thread pool, so slow verifications can't hold up logins and dashboards.
+# Every other route is the unchanged Flask app, run in its own thread pool via a2wsgi.
+# Shared state (embedding cache, batchers, audit log, image uploader, metrics) is api.py's.
+async_app = cors(Quart(__name__))
+async_app.config["MAX_CONTENT_LENGTH"] = api.app.config["MAX_CONTENT_LENGTH"]
+
+MODEL_EXECUTOR_WORKERS = int(os.getenv("async_model_workers", os.cpu_count() or 2))
+MODEL_QUEUE_LIMIT = int(os.getenv("async_model_queue", MODEL_EXECUTOR_WORKERS * 4))
+MODEL_QUEUE_TIMEOUT = float(os.getenv("async_model_timeout", 5))
+model_executor = ThreadPoolExecutor(max_workers=MODEL_EXECUTOR_WORKERS, thread_name_prefix="async-model")
+
+mongo = None
+db = None
+rollups = None
+log_store = None
+challenge_stats_fast = None
+http_client = None
+model_slots = None
+
+
+@async_app.before_serving
+async def connect():
+    global mongo, db, rollups, log_store, challenge_stats_fast, http_client, model_slots
+    mongo = AsyncIOMotorClient(api.URI)
+    db = mongo["Liveliness"]
+    rollups = AsyncRollups(db)
+    log_store = log_store_from_env(db, AsyncLogStore)
+    challenge_stats_fast = db["ChallengeStats"].with_options(write_concern=WriteConcern(w=0))
+    http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=16))
+    model_slots = asyncio.Semaphore(MODEL_QUEUE_LIMIT)
+
+
+@async_app.after_serving
+async def disconnect():
+    await http_client.aclose()
+    mongo.close()
+    model_executor.shutdown(wait=False)
+
+
+@async_app.before_request
+async def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@async_app.after_request
+async def record_request_metrics(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start, route=route)
+        metrics.inc("http_requests_total", route=route, status=response.status_code)
+    return response
+
+
+# Run a model call on the bounded executor. At most async_model_queue calls wait or run at
+# once; past that, callers wait up to async_model_timeout and then get PoolBusy (503)
+async def run_model(fn, *args):
+    try:
+        await asyncio.wait_for(model_slots.acquire(), MODEL_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolBusy("Model executor is saturated")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(model_executor, fn, *args)
+    finally:
+        model_slots.release()
+
+
+async def read_image(field):
+    return read_image_field(SimpleNamespace(files=await request.files, form=await request.form), field)
+
+
+async def location_for_log(latitude, longitude):
+    if api.GEOCODE_DEFERRED:
+        return api.geocoder.cached(latitude, longitude)
+    return await api.geocoder.lookup_async(latitude, longitude, http_client)
+
+
+async def fill_location_later(log_id, timestamp, latitude, longitude):
+    location = await api.geocoder.lookup_async(latitude, longitude, http_client)
+    await log_store.update_location(log_id, timestamp, location)
+
+
+# Buffered mode hands the log to api's AuditLogWriter in a worker thread: a full queue
+# makes write() wait and then insert synchronously, which must not stall the event loop.
+# Direct mode inserts through Motor and patches a pending location in a background task.
+async def insert_log(log, latitude=None, longitude=None):
+    if api.audit_log is not None:
+        await asyncio.to_thread(api.insert_log, log, latitude, longitude)
+        return
+
+    pending = log.get("location") is None
+    if pending:
+        log["location"] = dict(api.UNKNOWN_LOCATION)
+    result = await log_store.insert_one(log)
+    await rollups.record_logs([log])
+    if pending:
+        asyncio.create_task(fill_location_later(result.inserted_id, log["timestamp"], latitude, longitude))
+
+
+async def get_reference_embedding(email):
+    cached = api.embedding_cache.get(email)
+    if cached is not None:
+        return cached
+
+    user = await db["Users"].find_one({"email": email}, {"face_embedding": 1, "_id": 0})
+    if user and "face_embedding" in user:
+        embedding = api.normalize_embedding(decode_embedding(user["face_embedding"]))
+        api.embedding_cache.put(email, embedding)
+        return embedding
+    return None
+
+
+async def record_challenge_result(email, selected_task, correct):
+    field, user_update = api.challenge_result_update(selected_task, correct)
+    await db["ChallengeLogs"].update_one({"email": email}, user_update, upsert=True)
+    await challenge_stats_fast.update_one(
+        {"_id": datetime.datetime.now().strftime("%Y-%m-%d")}, {"$inc": {field: 1}}, upsert=True)
+    return "Correct" if correct else "Incorrect"
+
+
+@async_app.route("/login", methods=["POST"])
+async def login():
+    data = await request.get_json()
+    email = data.get("email")
+    password = data.get("password")
+    latitude = data.get("latitude")
+    longitude = data.get("longitude")
+    with metrics.stage("login", "geocode"):
+        location_data = await location_for_log(latitude, longitude) if latitude and longitude else {}
+    if not email or not password:
+        return jsonify({"status": "error", "message": "Missing email or password"}), 400
+
+    with metrics.stage("login", "user_lookup"):
+        user = await db["Users"].find_one({"email": email}, {"name": 1, "password": 1, "_id": 0})
+    name = user["name"] if user else None
+
+    if not user:
+        await insert_log({"email": email, "name": name, "status": "Rejected", "login_status": False, "verification_status": False,
+                          "detail": "User not found", "location": location_data, "timestamp": datetime.datetime.now()}, latitude, longitude)
+        return jsonify({"status": "error", "message": "User not found"}), 404
+
+    if user["password"] != password:
+        await insert_log({"email": email, "name": name, "status": "Rejected", "login_status": False, "verification_status": False,
+                          "detail": "Invalid password", "location": location_data, "timestamp": datetime.datetime.now()}, latitude, longitude)
+        return jsonify({"status": "error", "message": "Invalid password"}), 401
+
+    with metrics.stage("login", "admin_lookup"):
+        is_admin = await db["Admins"].find_one({"email": email}, {"_id": 1}) is not None
+    if is_admin:
+        await insert_log(
+            {"email": email, "name": name, "status": "Admin Login", "login_status": True, "verification_status": False,
+             "detail": "Admin Login", "location": location_data,
+             "timestamp": datetime.datetime.now()}, latitude, longitude)
+        return jsonify(
+            {"status": "success", "message": "Admin Login successful", "is_admin": is_admin})
+
+    await insert_log({"email": email, "name": name, "status": "In Process", "login_status": True, "verification_status": False,
+                      "detail": "Passed login, awaiting verification", "location": location_data, "timestamp": datetime.datetime.now()}, latitude, longitude)
+    return jsonify({"status": "success", "message": "Login successful, proceed to verification", "is_admin": is_admin})
+
+
+@async_app.route("/register", methods=["POST"])
+async def register():
+    try:
+        front_image = await read_image("frontImage")
+        left_image = await read_image("leftImage")
+        right_image = await read_image("rightImage")
+    except ImageTooLarge as e:
+        return jsonify({"status": "error", "message": str(e)}), 413
+    form = await request.form
+    name = form.get("name")
+    email = form.get("email")
+    password = form.get("password")
+    latitude = form.get('latitude')
+    longitude = form.get('longitude')
+
+    if not all([front_image, left_image, right_image, name, email, password]):
+        return jsonify({"status": "error", "message": "Missing required fields"}), 400
+
+    with metrics.stage("register", "geocode"):
+        location_data = await location_for_log(latitude, longitude) if latitude and longitude else {}
+
+    with metrics.stage("register", "user_lookup"):
+        existing_user = await db["Users"].find_one({"email": email}, {"_id": 1})
+    if existing_user:
+        return jsonify({"status": "error", "message": "User already exists"}), 400
+
+    with metrics.stage("register", "decode"):
+        pose_images = await asyncio.gather(asyncio.to_thread(decode_frame, left_image),
+                                           asyncio.to_thread(decode_frame, right_image))
+    try:
+        with metrics.stage("register", "detect_and_embed"):
+            detections = await run_model(api.get_face_batcher("register").map, pose_images)
+    except PoolBusy:
+        return jsonify({"status": "error", "message": "Server busy, try again"}), 503
+
+    embeddings = []
+    for i, detected in enumerate(detections, start=1):
+        if detected is None:
+            return jsonify({"status": "error", "message": f"No face detected in image {i + 1}"}), 400
+        embeddings.append(detected.embedding)
+
+    avg_embedding = np.mean(embeddings, axis=0)
+
+    with metrics.stage("register", "insert_user"):
+        await db["Users"].insert_one({
+            "name": name,
+            "email": email,
+            "password": password,
+            "user_image_key": user_image_key(email),
+            "user_image_status": "pending",
+            "face_embedding": encode_embedding(avg_embedding, api.EMBEDDING_STORAGE_DTYPE),
+            "timestamp": datetime.datetime.now()
+        })
+    # The uploader's own threads do the upload; this only waits if its queue is full
+    await asyncio.to_thread(store_user_image, api.image_uploader, api.User, email, front_image)
+    api.embedding_cache.put(email, api.normalize_embedding(avg_embedding))
+    await rollups.record_registration(datetime.datetime.now())
+    if api.gallery_synced_at is not None:
+        api.gallery.add(email, avg_embedding)
+
+    await insert_log({
+        "email": email,
+        "name": name,
+        "status": "In Process",
+        "login_status": True,
+        "verification_status": False,
+        "detail": "Registered",
+        "location": location_data,
+        "timestamp": datetime.datetime.now()
+    }, latitude, longitude)
+
+    return jsonify({"status": "success"})
+
+
+@async_app.route('/verify', methods=['POST'])
+async def verify():
+    try:
+        form = await request.form
+        email = form.get("email")
+        selected_task = form.get("task")
+        with metrics.stage("verify", "read_upload"):
+            image_data = await read_image("image")
+
+        if not email or not image_data:
+            return jsonify({"error": "Missing email or image"}), 400
+
+        with metrics.stage("verify", "decode"):
+            img = await asyncio.to_thread(decode_frame, image_data)
+        if img is None:
+            return jsonify({"error": "Invalid image format"}), 400
+
+        # Challenge sessions are api.py's, so a session opened here is also valid there
+        session_id = form.get("session_id")
+        session = api.challenge_sessions.get(session_id, email) if session_id and api.CHALLENGE_SESSIONS else None
+        if session is not None:
+            try:
+                with metrics.stage("verify", "session_checks"):
+                    session_result = await run_model(api.run_session_checks, img, session["continuity_embedding"])
+            except PoolBusy:
+                return jsonify({"error": "Server busy, try again"}), 503
+            if session_result is None:
+                return jsonify({"error": "No face detected in the captured image"}), 400
+            if session_result["continuity"] >= api.CONTINUITY_THRESHOLD:
+                api.challenge_sessions.record_reuse(session)
+                task_result = session_result["task_result"]
+                with metrics.stage("verify", "record_challenge"):
+                    task_validity = await record_challenge_result(email, selected_task, task_result == selected_task)
+                return jsonify({
+                    "face_match": "Matched",
+                    "similarity": round(session["similarity"], 2),
+                    "liveness_status": session["liveness_status"],
+                    "liveness_score": session["liveness_score"],
+                    "task_validity": task_validity,
+                    "session_id": session_id
+                })
+            api.challenge_sessions.discard(session_id, continuity_failed=True)
+
+        with metrics.stage("verify", "reference_embedding"):
+            reference_embedding = await get_reference_embedding(email)
+        if reference_embedding is None:
+            return jsonify({"error": "Reference embedding not found for this user"}), 404
+
+        try:
+            with metrics.stage("verify", "frame_checks"):
+                frame_result = await run_model(api.run_frame_checks, img)
+        except PoolBusy:
+            return jsonify({"error": "Server busy, try again"}), 503
+        if frame_result is None:
+            return jsonify({"error": "No face detected in the captured image"}), 400
+
+        similarity = np.dot(api.normalize_embedding(frame_result["embedding"]), reference_embedding)
+        task_result = frame_result["task_result"]
+
+        with metrics.stage("verify", "record_challenge"):
+            task_validity = await record_challenge_result(email, selected_task, task_result == selected_task)
+
+        session_id = None
+        if api.opens_challenge_session(frame_result, similarity):
+            try:
+                session_id = await run_model(api.open_challenge_session, email, img, frame_result, similarity)
+            except PoolBusy:
+                pass  # the frame is still verified, just without a session
+
+        return jsonify({
+            "face_match": "Matched" if similarity >= api.VERIFY_THRESHOLD else "Not Matched",
+            "similarity": round(float(similarity), 2),
+            "liveness_status": frame_result["liveness_status"],
+            "liveness_score": frame_result.get("liveness_score"),
+            "task_validity": task_validity,
+            "session_id": session_id
+        })
+
+    except ImageTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except HTTPException:
+        raise  # e.g. RequestEntityTooLarge (413) from a body over MAX_CONTENT_LENGTH
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@async_app.route('/active-users', methods=['GET'])
+@async_cached_json()
+async def active_users():
+    today = api.start_of_today()
+    ranges = api.active_users_ranges(today)
+    daily_counts, total, previous = await asyncio.gather(
+        rollups.active_users_per_day(*ranges["this_week"]),
+        rollups.unique_active_users(*ranges["this_week"]),
+        rollups.unique_active_users(*ranges["previous_week"]))
+    return api.active_users_summary(today, daily_counts, total, previous)
+
+
+@async_app.route('/auth-rates', methods=['GET'])
+@async_cached_json()
+async def get_auth_rates():
+    return api.auth_rates_summary(await rollups.status_totals(api.AUTH_RATE_STATUSES))
+
+
+@async_app.route('/average-session-duration', methods=['GET'])
+@async_cached_json()
+async def get_avg_session_duration():
+    try:
+        today = api.start_of_today()
+        ranges = api.session_duration_ranges(today)
+        days, previous_days = await asyncio.gather(rollups.days(*ranges["this_week"]),
+                                                   rollups.days(*ranges["previous_week"]))
+        return api.session_duration_summary(today, days, previous_days)
+    except Exception as e:
+        print("Error fetching session duration:", str(e))
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@async_app.route('/user-stats', methods=['GET'])
+@async_cached_json()
+async def get_user_stats():
+    try:
+        today = api.start_of_today()
+        total_users, days = await asyncio.gather(db["Users"].estimated_document_count(),
+                                                 rollups.days(*api.user_stats_range(today)))
+        return api.user_stats_summary(today, total_users, days)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Everything not routed above goes to the Flask app on its own bounded thread pool
+ASYNC_PATHS = {"/login", "/register", "/verify", "/active-users", "/auth-rates", "/average-session-duration",
+               "/user-stats"}
+flask_app = WSGIMiddleware(api.app, workers=int(os.getenv("async_wsgi_workers", 10)))
+
+
+async def application(scope, receive, send):
+    if scope["type"] != "http" or scope["path"] in ASYNC_PATHS:
+        await async_app(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:application", host=os.getenv("host", "127.0.0.1"), port=int(os.getenv("port", 5000)))
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from pymongo.errors import BulkWriteError
+from batcher import Histogram
+
+
+# Buffered writer for the Logs collection. Request threads only enqueue; a background
+# thread flushes with insert_many(ordered=False) when max_batch records are queued or
+# flush_interval seconds have passed. The queue is bounded: when it is full, writers wait
+# up to put_timeout and then fall back to a direct insert_one, so memory stays bounded
+# and a stuck flusher slows callers down instead of dropping logs.
+# on_flush, if given, is called with every list of records that was written.
+class AuditLogWriter:
+    def __init__(self, collection, max_batch=500, flush_interval=1.0, max_queue=10000, put_timeout=0.5,
+                 on_flush=None):
+        self.collection = collection
+        self.on_flush = on_flush
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self.written = 0
+        self.failed = 0
+        self.direct_writes = 0
+        self.flush_latency_ms = Histogram([1, 5, 10, 25, 50, 100, 250, 500, 1000])
+        self.enqueue_wait_ms = Histogram([0.1, 1, 10, 100, 500])
+        self.queue_depths = Histogram([0, 10, 100, 1000, 5000, 10000])
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        self.queue_depths.observe(self._queue.qsize())
+        start = time.perf_counter()
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            self.direct_writes += 1
+            self.collection.insert_one(record)
+            self._notify([record])
+        self._wakeup.set()
+        self.enqueue_wait_ms.observe((time.perf_counter() - start) * 1000)
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            self.written += len(batch) - len(failed)
+            self.failed += len(failed)
+            print("Audit log write errors:", len(failed))
+            batch = [record for i, record in enumerate(batch) if i not in failed]
+        except Exception as e:
+            self.failed += len(batch)
+            print("Audit log flush error:", e)
+            batch = []
+        self.flush_latency_ms.observe((time.perf_counter() - start) * 1000)
+        self._notify(batch)
+
+    def _notify(self, records):
+        if self.on_flush is None or not records:
+            return
+        try:
+            self.on_flush(records)
+        except Exception as e:
+            print("Audit log on_flush error:", e)
+
+    # Records stay in the queue until they are drained and inserted under _flush_lock, so
+    # flush() never misses one that the background thread is still waiting to batch
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._queue.empty():
+                continue
+            # Give the batch up to flush_interval to fill before writing
+            deadline = time.monotonic() + self.flush_interval
+            while self._queue.qsize() < self.max_batch and time.monotonic() < deadline:
+                if self._stopped.wait(min(0.05, self.flush_interval)):
+                    break
+            with self._flush_lock:
+                self._insert(self._drain())
+
+    # Change fields of a record passed to write(). A record that is still queued is updated
+    # in place and goes out with the new fields; update_stored() patches it if it was written.
+    # Both happen under _flush_lock, so the record can't be mid-insert in between.
+    def amend(self, record, fields, update_stored):
+        with self._flush_lock:
+            record.update(fields)
+            update_stored()
+
+    # Write out everything queued so far (used by readers that need their own writes)
+    def flush(self):
+        with self._flush_lock:
+            while not self._queue.empty():
+                self._insert(self._drain())
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "direct_writes": self.direct_writes,
+            "flush_latency_ms": self.flush_latency_ms.snapshot(),
+            "enqueue_wait_ms": self.enqueue_wait_ms.snapshot(),
+            "queue_depth_histogram": self.queue_depths.snapshot()
+        }
@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Simple bucketed histogram, enough to size the batcher from /batcher-stats
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.total += 1
+            self.sum += value
+
+    # Cumulative counts per upper bound (last one is +Inf), plus sum and count
+    def cumulative(self):
+        with self._lock:
+            counts, running = [], 0
+            for count in self.counts:
+                running += count
+                counts.append(running)
+            return self.buckets + [float("inf")], counts, self.sum, self.total
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"le_{bound}" for bound in self.buckets] + ["inf"]
+            return {
+                "buckets": dict(zip(labels, self.counts)),
+                "count": self.total,
+                "mean": round(self.sum / self.total, 3) if self.total else 0
+            }
+
+
+# Collects concurrent single-item requests and hands them to process_batch as one list.
+# A batch is dispatched once it has max_batch_size items or the oldest item has waited max_wait_ms.
+# process_batch must return one result per item, in order.
+class MicroBatcher:
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=5):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_depths = Histogram([0, 1, 2, 4, 8, 16, 32, 64])
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue_depths.observe(self._queue.qsize())
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def map(self, items):
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batch_sizes.observe(len(batch))
+            try:
+                results = self.process_batch([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "batch_size_histogram": self.batch_sizes.snapshot(),
+            "queue_depth_histogram": self.queue_depths.snapshot()
+        }
@@ -0,0 +1,293 @@
+import argparse
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import numpy as np
+import cv2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+STATUSES = ["Verified", "Rejected", "In Process", "Admin Login"]
+DETAILS = {"Verified": "Verified", "Rejected": "Invalid password", "In Process": "Passed login, awaiting verification",
+           "Admin Login": "Admin Login"}
+BENCH_LOCATION = {"city": "Bench City", "principalSubdivision": "Bench State", "countryName": "Benchland"}
+
+
+# Stands in for geocoding.Geocoder: fixed answer after an optional simulated delay
+class StubGeocoder:
+    def __init__(self, delay_ms=0.0):
+        self.delay = delay_ms / 1000
+        self.lookups = 0
+
+    def lookup(self, latitude, longitude):
+        self.lookups += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return dict(BENCH_LOCATION)
+
+    def cached(self, latitude, longitude):
+        return dict(BENCH_LOCATION)
+
+    def lookup_deferred(self, latitude, longitude, callback):
+        callback(self.lookup(latitude, longitude))
+
+    def stats(self):
+        return {"size": 0, "hits": 0, "misses": self.lookups, "errors": 0, "stub": True}
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Synthetic face images: the samples in images/ with seeded jitter in scale, rotation,
+# brightness/contrast and JPEG quality, so every run sends the same bytes
+def synthetic_images(image_dir, count, seed):
+    paths = sorted(p for p in glob.glob(os.path.join(image_dir, "**", "*"), recursive=True)
+                   if p.lower().endswith((".jpg", ".jpeg", ".png")))
+    sources = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not sources:
+        return []
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        img = sources[i % len(sources)]
+        h, w = img.shape[:2]
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), rng.uniform(-5, 5), rng.uniform(0.85, 1.15))
+        img = cv2.warpAffine(img, matrix, (w, h), borderMode=cv2.BORDER_REFLECT)
+        img = cv2.convertScaleAbs(img, alpha=rng.uniform(0.8, 1.2), beta=rng.uniform(-20, 20))
+        ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(70, 96))])
+        images.append(encoded.tobytes())
+    return images
+
+
+def configure_environment(args, image_root):
+    os.environ["image_store"] = "filesystem"
+    os.environ["image_store_path"] = image_root
+    os.environ["warm_up_on_start"] = "false"
+    if args.mongo_uri:
+        host = urlparse(args.mongo_uri).hostname
+        if host not in ("localhost", "127.0.0.1", "::1"):
+            raise SystemExit(f"Refusing to benchmark against non-local Mongo host {host}")
+        os.environ["mongo_URI"] = args.mongo_uri
+    else:
+        # In-process Mongo stand-in; api.py picks it up through pymongo.MongoClient
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+
+# N users (random embeddings, plus one real embedding per sample image when models are
+# enabled so /verify has matching references) and M logs spread over the last 30 days
+def populate(api, args, face_images, seed):
+    from embedding_codec import encode_embedding
+
+    rng = np.random.default_rng(seed)
+    for collection in [api.User, api.Admins, api.ChallengeLogs, api.ChallengeStats, api.rollups.daily,
+                       api.rollups.active] + api.log_store.collections():
+        collection.delete_many({})
+
+    now = datetime.datetime.now()
+    verify_users = []
+    if face_images:
+        for i, data in enumerate(face_images):
+            detected = api.detect_and_embed_batch([api.decode_frame(data)])[0]
+            if detected is not None:
+                verify_users.append((f"sample{i}@bench.local", data, detected.embedding))
+
+    users = [{"name": f"User {i}", "email": f"user{i}@bench.local", "password": "password",
+              "face_embedding": encode_embedding(rng.standard_normal(512)),
+              "timestamp": now - datetime.timedelta(days=int(rng.integers(0, 30)))}
+             for i in range(args.users)]
+    users += [{"name": email, "email": email, "password": "password", "face_embedding": encode_embedding(embedding),
+               "timestamp": now} for email, _, embedding in verify_users]
+    for start in range(0, len(users), 5000):
+        api.User.insert_many(users[start:start + 5000])
+    for user in users:
+        api.rollups.record_registration(user["timestamp"])
+    api.Admins.insert_one({"email": "user0@bench.local"})
+
+    for start in range(0, args.logs, 5000):
+        batch = []
+        for _ in range(min(5000, args.logs - start)):
+            status = STATUSES[int(rng.integers(0, len(STATUSES)))]
+            log = {"email": f"user{int(rng.integers(0, max(args.users, 1)))}@bench.local", "status": status,
+                   "detail": DETAILS[status], "login_status": status != "Rejected",
+                   "verification_status": status == "Verified", "location": dict(BENCH_LOCATION),
+                   "timestamp": now - datetime.timedelta(seconds=int(rng.integers(0, 30 * 86400)))}
+            if status == "Verified":
+                log["time_taken"] = float(rng.uniform(2, 30))
+            batch.append(log)
+        api.log_store.insert_many(batch)
+        api.rollups.record_logs(batch)
+    return verify_users
+
+
+def scenario_requests(name, args, verify_users, face_images, rng):
+    if name == "login":
+        for i in range(args.requests):
+            yield "post", "/login", {"json": {"email": f"user{int(rng.integers(1, max(args.users, 2)))}@bench.local",
+                                              "password": "password", "latitude": 12.97, "longitude": 77.59}}
+    elif name == "verify":
+        for i in range(args.requests):
+            email, data, _ = verify_users[i % len(verify_users)]
+            yield "post", "/verify", {"data": {"email": email, "task": "Front", "image": (io.BytesIO(data), "frame.jpg")},
+                                      "content_type": "multipart/form-data"}
+    elif name == "register":
+        for i in range(args.requests):
+            front, left, right = (face_images[(i + k) % len(face_images)] for k in range(3))
+            yield "post", "/register", {"data": {"name": f"New {i}", "email": f"new{i}-{time.time_ns()}@bench.local",
+                                                 "password": "password", "latitude": "12.97", "longitude": "77.59",
+                                                 "frontImage": (io.BytesIO(front), "front.jpg"),
+                                                 "leftImage": (io.BytesIO(left), "left.jpg"),
+                                                 "rightImage": (io.BytesIO(right), "right.jpg")},
+                                        "content_type": "multipart/form-data"}
+    else:
+        for i in range(args.requests):
+            yield "get", name, {}
+
+
+def run_scenario(app, name, requests, concurrency):
+    local = threading.local()
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def send(request):
+        method, path, kwargs = request
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = getattr(client, method)(path, **kwargs)
+        response.get_data()
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    requests = list(requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, requests))
+    wall = time.perf_counter() - start
+
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "max_ms": round(float(max(latencies)), 2),
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "rss_mb": round(current_rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+# End-to-end load benchmark through the Flask app, in-process. Mongo is mongomock by
+# default or a local mongod via --mongo-uri (it writes to the Liveliness database, so use
+# a throwaway instance); geocoding is stubbed and images are written to a temp directory.
+# Usage: python benchmarks/api_load_benchmark.py [--users 10000] [--logs 100000]
+#        [--concurrency 1 4 16] [--requests 200] [--skip-models] [--output results.json]
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--logs", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--scenarios", nargs="+",
+                        default=["login", "verify", "register", "/active-users", "/auth-rates",
+                                 "/average-session-duration", "/user-stats", "/get-logs?limit=50",
+                                 "/get-failed-tasks", "/get-top-rejected-users"])
+    parser.add_argument("--mongo-uri", help="local mongod to use instead of mongomock")
+    parser.add_argument("--geocode-delay-ms", type=float, default=0.0)
+    parser.add_argument("--images", default=os.path.join(ROOT, "images"))
+    parser.add_argument("--synthetic-images", type=int, default=32)
+    parser.add_argument("--skip-models", action="store_true", help="leave out /verify and /register")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here as well as to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as image_root:
+        configure_environment(args, image_root)
+        import api
+
+        geocoder = StubGeocoder(args.geocode_delay_ms)
+        api.geocoder = geocoder
+
+        face_images = [] if args.skip_models else synthetic_images(args.images, args.synthetic_images, args.seed)
+        if not face_images:
+            args.scenarios = [s for s in args.scenarios if s not in ("verify", "register")]
+        else:
+            api.warm_up()
+
+        start = time.perf_counter()
+        verify_users = populate(api, args, face_images, args.seed)
+        setup_s = time.perf_counter() - start
+        if not verify_users:
+            args.scenarios = [s for s in args.scenarios if s != "verify"]
+
+        results = []
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                rng = np.random.default_rng(args.seed)
+                result = run_scenario(api.app, name, scenario_requests(name, args, verify_users, face_images, rng),
+                                      concurrency)
+                results.append(result)
+                print(f"{name:<28} c={concurrency:<3} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                      f"p99={result['p99_ms']}ms {result['throughput_rps']} req/s rss={result['rss_mb']}MB "
+                      f"{result['status_codes']}", file=sys.stderr)
+
+        if api.audit_log is not None:
+            api.audit_log.flush()
+        api.image_uploader.close()
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {"users": args.users, "logs": args.logs, "requests": args.requests, "seed": args.seed,
+                   "mongo": "local" if args.mongo_uri else "mongomock", "geocode_delay_ms": args.geocode_delay_ms,
+                   "synthetic_images": len(face_images), "verify_users": len(verify_users)},
+        "setup_s": round(setup_s, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
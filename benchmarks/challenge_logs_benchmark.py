@@ -0,0 +1,109 @@
+import argparse
+import os
+import random
+import time
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import MongoClient, WriteConcern, monitoring
+
+POSES = ["Up", "Left", "Right", "Front"]
+READ_FIELDS = [
+    "correct_Up", "correct_Down", "correct_Left", "correct_Right", "correct_Front",
+    "failed_Up", "failed_Down", "failed_Left", "failed_Right", "failed_Front"
+]
+ZERO_FIELDS = ["correct_" + pose for pose in POSES] + ["failed_" + pose for pose in POSES]
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Write path before: upsert with $setOnInsert, then a separate $inc
+def write_before(collection, stats, email, field):
+    collection.update_one({"email": email}, {"$setOnInsert": {name: 0 for name in ZERO_FIELDS}}, upsert=True)
+    collection.update_one({"email": email}, {"$inc": {field: 1}})
+
+
+# Write path after: one upsert that increments and zero-fills the other counters, plus the
+# unacknowledged (w=0) per-day ChallengeStats upsert that record_challenge_result also makes
+def write_after(collection, stats, email, field):
+    collection.update_one({"email": email},
+                          {"$inc": {field: 1}, "$setOnInsert": {name: 0 for name in ZERO_FIELDS if name != field}},
+                          upsert=True)
+    stats.update_one({"_id": time.strftime("%Y-%m-%d")}, {"$inc": {field: 1}}, upsert=True)
+
+
+def read_before(collection):
+    return {field: collection.count_documents({field: {"$gt": 0}}) for field in READ_FIELDS}
+
+
+def read_after(collection):
+    pipeline = [{"$group": dict(
+        {"_id": None},
+        **{field: {"$sum": {"$cond": [{"$gt": ["$" + field, 0]}, 1, 0]}} for field in READ_FIELDS}
+    )}]
+    return next(collection.aggregate(pipeline), {})
+
+
+def measure(counter, fn, runs):
+    latencies = []
+    commands_before = counter.count
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+    return {
+        "round_trips_per_call": (counter.count - commands_before) / runs,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3)
+    }
+
+
+# Compares ChallengeLogs write and /get-failed-tasks read paths before and after the
+# single-upsert / single-aggregation change against a scratch database.
+# Usage: mongo_URI=... python benchmarks/challenge_logs_benchmark.py --users 5000
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=50)
+    parser.add_argument("--database", default="Liveliness_bench")
+    args = parser.parse_args()
+
+    load_dotenv()
+    counter = CommandCounter()
+    client = MongoClient(os.getenv("mongo_URI"), event_listeners=[counter])
+    collection = client[args.database]["ChallengeLogs"]
+    stats = client[args.database]["ChallengeStats"].with_options(write_concern=WriteConcern(w=0))
+    emails = [f"user{i}@example.com" for i in range(args.users)]
+
+    for name, write, read in [("before", write_before, read_before), ("after", write_after, read_after)]:
+        collection.drop()
+        client[args.database].drop_collection("ChallengeStats")
+        rng = random.Random(0)
+        for email in emails:
+            write(collection, stats, email, rng.choice(["correct_", "failed_"]) + rng.choice(POSES))
+
+        def one_write():
+            write(collection, stats, rng.choice(emails), rng.choice(["correct_", "failed_"]) + rng.choice(POSES))
+
+        print(name, "write", measure(counter, one_write, args.writes))
+        print(name, "read ", measure(counter, lambda: read(collection), args.reads))
+
+    collection.drop()
+    client[args.database].drop_collection("ChallengeStats")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gallery import FaceGallery, hnswlib
+
+
+# Query latency of the /identify gallery on synthetic identities.
+# Usage: python benchmarks/gallery_benchmark.py --sizes 10000 100000 1000000
+def run(size, queries, k, use_ann, seed):
+    rng = np.random.default_rng(seed)
+    ann_threshold = 0 if use_ann else size + 1
+    gallery = FaceGallery(initial_capacity=size, ann_threshold=ann_threshold)
+
+    start = time.perf_counter()
+    chunk = 50000
+    for offset in range(0, size, chunk):
+        n = min(chunk, size - offset)
+        embeddings = rng.standard_normal((n, gallery.dim), dtype=np.float32)
+        gallery.add_many([f"user{offset + i}@example.com" for i in range(n)], embeddings)
+    build_time = time.perf_counter() - start
+
+    # Queries are noisy copies of enrolled identities, so recall@1 is measurable
+    targets = rng.integers(0, size, queries)
+    probes = gallery._matrix[targets] + 0.3 * rng.standard_normal((queries, gallery.dim), dtype=np.float32)
+
+    latencies, correct = [], 0
+    for target, probe in zip(targets, probes):
+        start = time.perf_counter()
+        matches = gallery.search(probe, k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += matches[0][0] == f"user{target}@example.com"
+
+    latencies = np.array(latencies)
+    return {
+        "size": size,
+        "mode": "hnsw" if use_ann else "exact",
+        "build_s": round(build_time, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "recall@1": round(correct / queries, 4)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    modes = [False, True] if hnswlib is not None else [False]
+    for size in args.sizes:
+        for use_ann in modes:
+            print(run(size, args.queries, args.k, use_ann, args.seed))
@@ -0,0 +1,87 @@
+import argparse
+import base64
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def make_jpeg(width, height, seed=0):
+    import cv2
+    samples = glob.glob(os.path.join(ROOT, "images", "*.jp*g"))
+    if samples:
+        img = cv2.resize(cv2.imread(samples[seed % len(samples)]), (width, height))
+    else:
+        rng = np.random.default_rng(seed)
+        img = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 5)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+# Old /register path: base64 decode, write to images/, read back with cv2.imread
+def decode_old(data_url, tmpdir):
+    import cv2
+    filename = os.path.join(tmpdir, "frame.jpeg")
+    with open(filename, "wb") as f:
+        f.write(base64.b64decode(data_url.split(",")[1]))
+    return cv2.imread(filename)
+
+
+def decode_new(data_url, tmpdir):
+    from ingest import decode_data_url, decode_frame
+    return decode_frame(decode_data_url(data_url))
+
+
+def run_mode(mode, width, height, runs):
+    data_url = "data:image/jpeg;base64," + base64.b64encode(make_jpeg(width, height)).decode()
+    decode = decode_old if mode == "old" else decode_new
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for _ in range(runs):
+            start = time.perf_counter()
+            img = decode(data_url, tmpdir)
+            latencies.append((time.perf_counter() - start) * 1000)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "source": f"{width}x{height}",
+        "decoded": f"{img.shape[1]}x{img.shape[0]}",
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "peak_rss_delta_kb": peak_rss - baseline_rss
+    }
+
+
+# Decode latency and peak RSS of the old (temp file + imread) and new (in-memory,
+# reduced-scale) ingest paths. Each mode runs in its own process so RSS peaks don't mix.
+# Usage: python benchmarks/ingest_benchmark.py --sizes 1280x720 1920x1080 4032x3024
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", default=["1280x720", "1920x1080", "4032x3024"])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "SIZE", "RUNS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, size, runs = args.child
+        width, height = map(int, size.split("x"))
+        print(json.dumps(run_mode(mode, width, height, int(runs))))
+        return
+
+    for size in args.sizes:
+        for mode in ["old", "new"]:
+            output = subprocess.run([sys.executable, __file__, "--child", mode, size, str(args.runs)],
+                                    capture_output=True, text=True, check=True).stdout
+            print(output.strip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import face_pipeline
+from ingest import decode_frame
+from liveness import LivenessEngine
+
+
+def load_faces(paths):
+    faces = []
+    for path in paths:
+        with open(path, "rb") as f:
+            img = decode_frame(f.read())
+        if img is None:
+            continue
+        analysis = face_pipeline.build_frame_analysis(img, face_pipeline.detect_and_embed_batch([img])[0])
+        if analysis is not None:
+            faces.append((path, img, analysis["facial_area"]))
+    return faces
+
+
+# Platt scaling: fit sigmoid(a * logit(p) + b) to labels (1 = live) by Newton's method
+def fit_platt(scores, labels, iterations=50):
+    p = np.clip(np.asarray(scores, dtype=np.float64), 1e-6, 1 - 1e-6)
+    x = np.stack([np.log(p / (1 - p)), np.ones_like(p)], axis=1)
+    y = np.asarray(labels, dtype=np.float64)
+    params = np.array([1.0, 0.0])
+    for _ in range(iterations):
+        predicted = 1 / (1 + np.exp(-x @ params))
+        gradient = x.T @ (predicted - y)
+        hessian = x.T @ (x * (predicted * (1 - predicted))[:, None]) + 1e-6 * np.eye(2)
+        params -= np.linalg.solve(hessian, gradient)
+    return params
+
+
+def percentiles(values):
+    return f"p50={np.percentile(values, 50):.2f}ms p95={np.percentile(values, 95):.2f}ms"
+
+
+# DeepFace Fasnet vs the ONNX Runtime engine: per-face latency, batched throughput and
+# status agreement on the sample images. With --labels (CSV of path,live|spoof) it also
+# fits the Platt calibration and prints the liveness_calibration value to use.
+# Usage: python benchmarks/liveness_benchmark.py [--images DIR] [--labels CSV] [--threads N]
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=os.path.join(ROOT, "images"))
+    parser.add_argument("--labels")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("liveness_intra_threads", 2)))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    labels = {}
+    if args.labels:
+        with open(args.labels, newline="") as f:
+            labels = {os.path.abspath(row[0]): row[1].strip().lower() == "live" for row in csv.reader(f) if row}
+        paths = sorted(labels)
+    else:
+        paths = sorted(p for p in glob.glob(os.path.join(args.images, "**", "*"), recursive=True)
+                       if p.lower().endswith((".jpg", ".jpeg", ".png")))
+
+    faces = load_faces(paths)
+    if not faces:
+        print("No faces found")
+        return 1
+
+    deepface_model = face_pipeline.get_antispoof_model()
+    engine = LivenessEngine(intra_threads=args.threads)
+    deepface_model.analyze(img=faces[0][1], facial_area=faces[0][2])
+    engine.score([faces[0][1:]])
+
+    deepface_ms, onnx_ms, agree, onnx_scores = [], [], 0, []
+    for _ in range(args.repeat):
+        for path, img, facial_area in faces:
+            start = time.perf_counter()
+            is_real, confidence = deepface_model.analyze(img=img, facial_area=facial_area)
+            deepface_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            result = engine.score([(img, facial_area)])["results"][0]
+            onnx_ms.append((time.perf_counter() - start) * 1000)
+            # Same P(real) > 0.5 rule check_liveness applies to both backends
+            agree += (result["status"] == "Live") == (face_pipeline.deepface_real_score(is_real, confidence) > 0.5)
+            onnx_scores.append(result["score"])
+
+    print(f"faces={len(faces)} onnx_intra_threads={args.threads}")
+    print(f"deepface   {percentiles(deepface_ms)}")
+    print(f"onnx       {percentiles(onnx_ms)}")
+    print(f"Live/Spoof agreement: {agree / (len(faces) * args.repeat):.1%}")
+
+    for batch_size in (1, 4, 8, 16, 32):
+        batch = [faces[i % len(faces)][1:] for i in range(batch_size)]
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            engine.score(batch)
+        elapsed = time.perf_counter() - start
+        print(f"onnx batch={batch_size:<3} {batch_size * args.repeat / elapsed:.1f} faces/sec")
+
+    if labels:
+        scores = onnx_scores[:len(faces)]
+        truth = [labels[os.path.abspath(path)] for path, _, _ in faces]
+        a, b = fit_platt(scores, truth)
+        calibrated = LivenessEngine(intra_threads=args.threads, calibration=(a, b))
+        predicted = [r["status"] == "Live" for r in calibrated.score([f[1:] for f in faces])["results"]]
+        accuracy = np.mean(np.array(predicted) == np.array(truth))
+        print(f"Calibrated accuracy {accuracy:.1%} with liveness_calibration={a:.4f},{b:.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import argparse
+import glob
+import itertools
+import os
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import face_pipeline
+from ingest import decode_frame
+
+
+# Latency and agreement of the InsightFace and MediaPipe pose backends on the images/
+# samples, plus a threshold sweep that finds the InsightFace settings closest to the
+# current MediaPipe behaviour. Usage: python benchmarks/pose_benchmark.py [--images DIR]
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=os.path.join(ROOT, "images"))
+    args = parser.parse_args()
+
+    paths = sorted(p for p in glob.glob(os.path.join(args.images, "**", "*"), recursive=True)
+                   if p.lower().endswith((".jpg", ".jpeg", ".png")))
+    if not paths:
+        print("No sample images found in", args.images)
+        return 1
+
+    face_pipeline.warm_up()
+    if "landmark_3d_68" not in face_pipeline.get_face_analysis().models:
+        print("landmark_3d_68 model not loaded in this inference profile; nothing to compare")
+        return 1
+    rows = []
+    timings = {"insightface": [], "mediapipe": []}
+    for path in paths:
+        with open(path, "rb") as f:
+            img = decode_frame(f.read())
+        if img is None:
+            continue
+        analysis = face_pipeline.build_frame_analysis(img, face_pipeline.detect_and_embed_batch([img])[0])
+        if analysis is None:
+            continue
+
+        start = time.perf_counter()
+        insightface_label = face_pipeline.estimate_head_position(img, analysis, backend="insightface")
+        timings["insightface"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        mediapipe_label = face_pipeline.estimate_head_position(img, analysis, backend="mediapipe")
+        timings["mediapipe"].append((time.perf_counter() - start) * 1000)
+
+        pitch, yaw, _ = analysis["face"].pose
+        rows.append((os.path.relpath(path, args.images), pitch, yaw, insightface_label, mediapipe_label))
+
+    if not rows:
+        print("No faces detected in sample images")
+        return 1
+
+    for backend, values in timings.items():
+        print(f"{backend:<12} p50={np.percentile(values, 50):.2f}ms p95={np.percentile(values, 95):.2f}ms")
+    agreement = sum(row[3] == row[4] for row in rows) / len(rows)
+    print(f"Agreement with current thresholds: {agreement:.1%} over {len(rows)} faces")
+    for name, pitch, yaw, insightface_label, mediapipe_label in rows:
+        if insightface_label != mediapipe_label:
+            print(f"  {name}: pitch={pitch:.1f} yaw={yaw:.1f} insightface={insightface_label} mediapipe={mediapipe_label}")
+
+    # Calibration: thresholds that best reproduce the MediaPipe labels
+    best = max(
+        ((sum(face_pipeline.classify_pose(pitch, yaw, yaw_t, pitch_t, yaw_s, pitch_s) == label
+              for _, pitch, yaw, _, label in rows), yaw_t, pitch_t, yaw_s, pitch_s)
+         for yaw_t, pitch_t, yaw_s, pitch_s in itertools.product(range(5, 41), range(5, 41), (1, -1), (1, -1))),
+        key=lambda result: result[0])
+    print(f"Best calibration: {best[0] / len(rows):.1%} agreement with "
+          f"pose_yaw_threshold={best[1]} pose_pitch_threshold={best[2]} pose_yaw_sign={best[3]} "
+          f"pose_pitch_sign={best[4]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from face_pipeline import PROFILES
+
+# Runs in a fresh interpreter per profile so RSS reflects only that profile's models
+PROFILE_SNIPPET = """
+import json, resource, sys, time
+import face_pipeline
+from ingest import decode_frame
+
+profile, paths, repeat = sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3])
+start = time.perf_counter()
+face_pipeline.get_face_analysis(profile)
+load_s = time.perf_counter() - start
+images = []
+for path in paths:
+    with open(path, "rb") as f:
+        images.append(decode_frame(f.read()))
+face_pipeline.detect_and_embed_batch(images[:1], profile)
+
+latencies, embeddings = [], {}
+for _ in range(repeat):
+    for path, img in zip(paths, images):
+        start = time.perf_counter()
+        detected = face_pipeline.detect_and_embed_batch([img], profile)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        if detected is not None:
+            embeddings[path] = detected.normed_embedding.tolist()
+print(json.dumps({"load_s": load_s, "latencies_ms": latencies, "embeddings": embeddings,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def run_profile(profile, paths, repeat):
+    result = subprocess.run([sys.executable, "-c", PROFILE_SNIPPET, profile, json.dumps(paths), str(repeat)],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"{profile} failed:", result.stderr.strip().splitlines()[-1:] or result.returncode)
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Agreement of a profile with the reference profile: cosine similarity of the two
+# embeddings of the same image, and how many same/different-person decisions at the
+# 0.5 threshold change when every pair of images is compared
+def agreement(reference, candidate, threshold=0.5):
+    paths = sorted(set(reference) & set(candidate))
+    if not paths:
+        return None
+    ref = np.array([reference[p] for p in paths])
+    cand = np.array([candidate[p] for p in paths])
+    upper = np.triu_indices(len(paths), k=1)
+    ref_decisions = (ref @ ref.T)[upper] >= threshold
+    cand_decisions = (cand @ cand.T)[upper] >= threshold
+    return {
+        "faces": len(paths),
+        "self_similarity_min": round(float(np.einsum("ij,ij->i", ref, cand).min()), 4),
+        "self_similarity_mean": round(float(np.einsum("ij,ij->i", ref, cand).mean()), 4),
+        "pair_decisions_changed": int(np.sum(ref_decisions != cand_decisions)),
+        "pairs": int(len(ref_decisions))
+    }
+
+
+# Latency, RSS and match-score agreement per inference profile on the sample images.
+# Usage: python benchmarks/profile_benchmark.py [--images DIR] [--repeat 3] [--json]
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=os.path.join(ROOT, "images"))
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    parser.add_argument("--reference", default="accurate")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.abspath(p) for p in glob.glob(os.path.join(args.images, "**", "*"), recursive=True)
+                   if p.lower().endswith((".jpg", ".jpeg", ".png")))
+    if not paths:
+        print("No sample images found in", args.images)
+        return 1
+
+    runs = {profile: run_profile(profile, paths, args.repeat) for profile in args.profiles}
+    reference = runs.get(args.reference)
+    report = {}
+    for profile, run in runs.items():
+        if run is None:
+            continue
+        report[profile] = {
+            "config": PROFILES[profile],
+            "load_s": round(run["load_s"], 3),
+            "p50_ms": round(float(np.percentile(run["latencies_ms"], 50)), 2),
+            "p95_ms": round(float(np.percentile(run["latencies_ms"], 95)), 2),
+            "max_rss_mb": round(run["max_rss_mb"], 1),
+            "faces_detected": len(run["embeddings"]),
+            "agreement": agreement(reference["embeddings"], run["embeddings"]) if reference else None
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    for profile, row in report.items():
+        print(f"{profile:<10} load={row['load_s']}s p50={row['p50_ms']}ms p95={row['p95_ms']}ms "
+              f"rss={row['max_rss_mb']}MB faces={row['faces_detected']}/{len(paths)}")
+        if row["agreement"]:
+            print(f"{'':<10} vs {args.reference}: {row['agreement']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+COMPONENTS = ["numpy", "cv2", "flask", "pymongo", "requests", "azure.storage.blob",
+              "insightface.app", "mediapipe", "deepface"]
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+MODEL_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import face_pipeline
+import_time = time.perf_counter() - start
+load_times = face_pipeline.warm_up()
+print(json.dumps({"import_face_pipeline": import_time, **load_times, "total": time.perf_counter() - start}))
+"""
+
+APP_SNIPPET = """
+import time
+start = time.perf_counter()
+import api
+print(time.perf_counter() - start)
+"""
+
+
+def run_python(snippet, env=None):
+    result = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, capture_output=True, text=True,
+                            env={**os.environ, **(env or {})})
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip().splitlines()[-1]
+
+
+# Cold-start breakdown: each measurement runs in a fresh interpreter so import caches don't leak
+# between components. Usage: python benchmarks/startup_benchmark.py [--repeat 3] [--json]
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {"imports": {}, "models": [], "app_import": []}
+    for module in COMPONENTS:
+        times = [run_python(IMPORT_SNIPPET.format(module=module)) for _ in range(args.repeat)]
+        times = [float(t) for t in times if t is not None]
+        report["imports"][module] = round(min(times), 3) if times else None
+
+    for _ in range(args.repeat):
+        output = run_python(MODEL_SNIPPET)
+        if output:
+            report["models"].append({k: round(v, 3) for k, v in json.loads(output).items()})
+
+        output = run_python(APP_SNIPPET, env={"warm_up_on_start": "false"})
+        if output:
+            report["app_import"].append(round(float(output), 3))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("Import time per component (s, best of %d):" % args.repeat)
+    for module, seconds in report["imports"].items():
+        print(f"  {module:<22} {seconds if seconds is not None else 'not installed'}")
+    print("Model load / warm-up (s):")
+    for run in report["models"]:
+        print("  " + ", ".join(f"{k}={v}" for k, v in run.items()))
+    print("import api with lazy models (s):", report["app_import"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import csv
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from rollups import Rollups
+from embedding_codec import encode_embedding
+from image_store import AsyncImageUploader, image_store_from_env, store_user_image, user_image_key
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# Manifest rows: name, email, password, front, left, right (image paths relative to the CSV)
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield {
+                "name": row["name"],
+                "email": row["email"],
+                "password": row["password"],
+                "images": [os.path.join(base, row[pose]) for pose in ("front", "left", "right")]
+            }
+
+
+# Directory layout: <root>/<email>/{front,left,right}.<ext>
+def read_directory(root, default_password):
+    for email in sorted(os.listdir(root)):
+        user_dir = os.path.join(root, email)
+        if not os.path.isdir(user_dir):
+            continue
+        files = {os.path.splitext(name)[0].lower(): os.path.join(user_dir, name)
+                 for name in os.listdir(user_dir) if name.lower().endswith(IMAGE_EXTENSIONS)}
+        yield {
+            "name": email.split("@")[0],
+            "email": email,
+            "password": default_password,
+            "images": [files.get(pose) for pose in ("front", "left", "right")]
+        }
+
+
+def init_worker():
+    from face_pipeline import get_face_analysis, profile_for
+    get_face_analysis(profile_for("register"))
+
+
+# Runs in a worker process: same detection + recognition as /register, which
+# averages the embeddings of the left and right images. Any error is reported for
+# this user only, so one bad file can't abort the run.
+def embed_user(entry):
+    try:
+        return _embed_user(entry)
+    except Exception as e:
+        return entry["email"], None, f"error: {e}"
+
+
+def _embed_user(entry):
+    from face_pipeline import detect_and_embed_batch, profile_for
+    from ingest import decode_frame
+
+    if entry["images"][0] is None or not os.path.exists(entry["images"][0]):
+        return entry["email"], None, f"missing front image {entry['images'][0]}"
+
+    pose_images = []
+    for path in entry["images"][1:]:
+        if path is None or not os.path.exists(path):
+            return entry["email"], None, f"missing image {path}"
+        with open(path, "rb") as f:
+            img = decode_frame(f.read(), max_bytes=None)  # local files: no HTTP upload limit
+        if img is None:
+            return entry["email"], None, f"could not decode {path}"
+        pose_images.append(img)
+
+    embeddings = []
+    for path, detected in zip(entry["images"][1:], detect_and_embed_batch(pose_images, profile_for("register"))):
+        if detected is None:
+            return entry["email"], None, f"no face detected in {path}"
+        embeddings.append(detected.embedding)
+    return entry["email"], np.mean(embeddings, axis=0), None
+
+
+# Insert a batch of users, then queue their front images for upload
+def flush(users_collection, users, front_images, rollups, uploader):
+    if not users:
+        return 0
+    failed = set()
+    try:
+        users_collection.insert_many(users, ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        print(f"{len(failed)} users failed to insert (already enrolled?)")
+    rollups.record_registration(datetime.datetime.now(), count=len(users) - len(failed))
+
+    for i, (user, path) in enumerate(zip(users, front_images)):
+        if i not in failed:
+            with open(path, "rb") as f:
+                store_user_image(uploader, users_collection, user["email"], f.read())
+    return len(users) - len(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll users from a directory or CSV manifest")
+    parser.add_argument("source", help="directory of <email>/{front,left,right} images, or a CSV manifest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=500, help="users per insert_many")
+    parser.add_argument("--default-password", default=None, help="password for directory mode")
+    parser.add_argument("--report", default="enroll_failures.csv", help="CSV of users that could not be enrolled")
+    args = parser.parse_args()
+
+    if args.source.endswith(".csv"):
+        entries = list(read_manifest(args.source))
+    else:
+        if args.default_password is None:
+            parser.error("--default-password is required in directory mode")
+        entries = list(read_directory(args.source, args.default_password))
+
+    load_dotenv()
+    db = MongoClient(os.getenv("mongo_URI"))['Liveliness']
+    users_collection = db['Users']
+
+    rollups = Rollups(db)
+    storage_dtype = os.getenv("embedding_storage_dtype", "float32")
+    uploader = AsyncImageUploader(image_store_from_env(), max_workers=8, max_pending=args.batch_size * 2)
+
+    # Resume: skip anyone already enrolled, but re-queue front images whose upload was
+    # still pending or had failed when the previous run stopped
+    enrolled = set()
+    retry_uploads = []
+    emails = [entry["email"] for entry in entries]
+    for offset in range(0, len(emails), 10000):
+        for user in users_collection.find({"email": {"$in": emails[offset:offset + 10000]}},
+                                          {"email": 1, "user_image_status": 1, "_id": 0}):
+            enrolled.add(user["email"])
+            if user.get("user_image_status") in ("pending", "failed"):
+                retry_uploads.append(user["email"])
+    pending = {entry["email"]: entry for entry in entries if entry["email"] not in enrolled}
+    print(f"{len(entries)} users in source, {len(enrolled)} already enrolled "
+          f"({len(retry_uploads)} with image uploads to retry), {len(pending)} to process")
+
+    entries_by_email = {entry["email"]: entry for entry in entries}
+    for email in retry_uploads:
+        path = entries_by_email[email]["images"][0]
+        if path is None or not os.path.exists(path):
+            print(f"Cannot retry image upload for {email}: missing front image {path}")
+            continue
+        with open(path, "rb") as f:
+            store_user_image(uploader, users_collection, email, f.read())
+
+    start = time.perf_counter()
+    processed = inserted = embedded_images = 0
+    batch, front_images = [], []
+    with open(args.report, "a", newline="") as report_file, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+        report = csv.writer(report_file)
+        for email, embedding, error in executor.map(embed_user, pending.values(), chunksize=8):
+            processed += 1
+            entry = pending[email]
+            if error:
+                report.writerow([email, error])
+            else:
+                embedded_images += 2  # left and right; the front image is only stored
+                batch.append({
+                    "name": entry["name"],
+                    "email": email,
+                    "password": entry["password"],
+                    "user_image_key": user_image_key(email),
+                    "user_image_status": "pending",
+                    "face_embedding": encode_embedding(embedding, storage_dtype),
+                    "timestamp": datetime.datetime.now()
+                })
+                front_images.append(entry["images"][0])
+
+            if len(batch) >= args.batch_size:
+                inserted += flush(users_collection, batch, front_images, rollups, uploader)
+                batch, front_images = [], []
+                report_file.flush()
+
+            if processed % 100 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{processed}/{len(pending)} users, {embedded_images / elapsed:.1f} images/sec")
+
+        inserted += flush(users_collection, batch, front_images, rollups, uploader)
+    uploader.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Enrolled {inserted} of {len(pending)} users in {elapsed:.1f}s "
+          f"({embedded_images / elapsed if elapsed else 0:.1f} images/sec); failures in {args.report}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+# Server-side state for one liveness challenge (one /verify call per pose).
+# The first frame goes through full verification; if it matched and was live, a session
+# records that verdict with the frame's continuity embedding. Later frames that carry the
+# session_id only need the pose and a continuity check against that embedding.
+# Sessions expire ttl seconds after creation (not after last use) and the store is a
+# bounded LRU, like EmbeddingCache.
+class ChallengeSessions:
+    def __init__(self, ttl=120, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.expired = 0
+        self.continuity_failures = 0
+
+    def create(self, email, continuity_embedding, similarity, liveness_status, liveness_score):
+        session_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._sessions[session_id] = {
+                "email": email,
+                "continuity_embedding": continuity_embedding,
+                "similarity": similarity,
+                "liveness_status": liveness_status,
+                "liveness_score": liveness_score,
+                "expires_at": time.monotonic() + self.ttl,
+                "frames": 1
+            }
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+            self.created += 1
+        return session_id
+
+    # The session for this id, if it exists, hasn't expired and belongs to this email
+    def get(self, session_id, email):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if session["expires_at"] < time.monotonic():
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            if session["email"] != email:
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def record_reuse(self, session):
+        with self._lock:
+            session["frames"] += 1
+            self.reused += 1
+
+    def discard(self, session_id, continuity_failed=False):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if continuity_failed:
+                self.continuity_failures += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._sessions),
+                "ttl": self.ttl,
+                "created": self.created,
+                "reused": self.reused,
+                "expired": self.expired,
+                "continuity_failures": self.continuity_failures
+            }
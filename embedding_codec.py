@@ -0,0 +1,43 @@
+import struct
+import numpy as np
+from bson import Binary
+
+# Packed embedding format stored in Users.face_embedding:
+#   byte 0: format version (1)
+#   byte 1: dtype code (see DTYPES)
+#   int8 only: float32 scale, little-endian
+#   rest:   the unit-normalized vector in that dtype, little-endian
+# Older documents hold a plain BSON array of doubles; decode_embedding reads both.
+FORMAT_VERSION = 1
+DTYPES = {"float32": (1, np.dtype("<f4")), "float16": (2, np.dtype("<f2")), "int8": (3, np.dtype("i1"))}
+DTYPE_CODES = {code: (name, dtype) for name, (code, dtype) in DTYPES.items()}
+
+
+def encode_embedding(embedding, dtype="float32"):
+    code, np_dtype = DTYPES[dtype]
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector = vector / np.linalg.norm(vector)
+    header = struct.pack("<BB", FORMAT_VERSION, code)
+
+    if dtype == "int8":
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        payload = np.round(vector / scale).astype(np_dtype).tobytes()
+        return Binary(header + struct.pack("<f", scale) + payload)
+    return Binary(header + vector.astype(np_dtype).tobytes())
+
+
+# Returns a float32 vector. float32 payloads are a zero-copy (read-only) view of the BSON bytes.
+def decode_embedding(value):
+    if isinstance(value, (list, tuple)):
+        return np.asarray(value, dtype=np.float32)
+
+    version, code = struct.unpack_from("<BB", value)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version {version}")
+    name, np_dtype = DTYPE_CODES[code]
+
+    if name == "int8":
+        scale, = struct.unpack_from("<f", value, 2)
+        return np.frombuffer(value, dtype=np_dtype, offset=6).astype(np.float32) * np.float32(scale)
+    vector = np.frombuffer(value, dtype=np_dtype, offset=2)
+    return vector if name == "float32" else vector.astype(np.float32)
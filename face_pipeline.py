@@ -0,0 +1,438 @@
+import os
+import threading
+import time
+import numpy as np
+import cv2
+from metrics import registry as metrics
+
+
+# Face models and per-frame analysis stages. Kept apart from api.py so that model
+# worker processes can load them without the web app, Mongo or Azure clients.
+# Models (and their heavy imports) load on first use; warm_up() loads them all up front.
+_models = {}
+_model_lock = threading.RLock()
+load_times = {}
+
+
+def _load(name, loader):
+    model = _models.get(name)
+    if model is None:
+        with _model_lock:
+            model = _models.get(name)
+            if model is None:
+                start = time.perf_counter()
+                model = loader()
+                load_times[name] = round(time.perf_counter() - start, 3)
+                _models[name] = model
+    return model
+
+
+# Inference profiles: which InsightFace pack supplies the detector, at what input size,
+# which optional modules are loaded, and which pack supplies the recognition model.
+# Embeddings are only comparable between profiles sharing a recognition_pack, so "fast"
+# swaps in buffalo_s's small detector but keeps buffalo_l's ArcFace model; pose falls back
+# to MediaPipe there since landmark_3d_68 isn't loaded. Gender/age and the 2D landmarks
+# are never loaded.
+PROFILES = {
+    "accurate": {"pack": "buffalo_l", "det_size": 640, "modules": ["landmark_3d_68"], "recognition_pack": "buffalo_l"},
+    "fast": {"pack": "buffalo_s", "det_size": 320, "modules": [], "recognition_pack": "buffalo_l"},
+}
+INFERENCE_PROFILE = os.getenv("inference_profile", "accurate")
+
+
+# Profile for one endpoint: <endpoint>_profile (e.g. register_profile, verify_profile),
+# falling back to inference_profile
+def profile_for(endpoint):
+    return os.getenv(f"{endpoint}_profile", INFERENCE_PROFILE)
+
+
+def active_profiles():
+    return sorted({INFERENCE_PROFILE, profile_for("register"), profile_for("verify"), profile_for("identify")})
+
+
+def _load_recognition_model(pack):
+    import glob
+    from insightface.model_zoo import model_zoo
+    from insightface.utils import ensure_available
+
+    model_dir = ensure_available("models", pack, root="~/.insightface")
+    for path in sorted(glob.glob(os.path.join(model_dir, "*.onnx"))):
+        model = model_zoo.get_model(path)
+        if model is not None and model.taskname == "recognition":
+            model.prepare(ctx_id=0)
+            return model
+    raise RuntimeError(f"No recognition model in {pack}")
+
+
+def _load_face_analysis(profile):
+    from insightface.app import FaceAnalysis
+    config = PROFILES[profile]
+    modules = ["detection"] + config["modules"]
+    if config["recognition_pack"] == config["pack"]:
+        modules.append("recognition")
+    face = FaceAnalysis(name=config["pack"], allowed_modules=modules)
+    face.prepare(ctx_id=0, det_size=(config["det_size"], config["det_size"]))
+    if "recognition" not in face.models:
+        face.models["recognition"] = _load_recognition_model(config["recognition_pack"])
+    return face
+
+
+def _load_face_mesh():
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+
+def _load_antispoof_model():
+    from deepface.modules import modeling
+    return modeling.build_model(task="spoofing", model_name="Fasnet")
+
+
+def _load_liveness_engine():
+    from liveness import liveness_engine_from_env
+    return liveness_engine_from_env()
+
+
+def get_face_analysis(profile=None):
+    profile = profile or INFERENCE_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown inference profile {profile}")
+    return _load(f"face_analysis:{profile}", lambda: _load_face_analysis(profile))
+
+
+def get_face_mesh():
+    return _load("face_mesh", _load_face_mesh)
+
+
+# DeepFace's anti-spoofing model, loaded once and called on an existing facial area
+def get_antispoof_model():
+    return _load("antispoof", _load_antispoof_model)
+
+
+# Fasnet exported to ONNX and run in a tuned ONNX Runtime session (see liveness.py)
+def get_liveness_engine():
+    return _load("liveness_engine", _load_liveness_engine)
+
+
+# FaceMesh keeps tracking state and is not safe to call from several threads at once
+face_mesh_lock = threading.Lock()
+
+
+# Detection only, one frame at a time (RetinaFace doesn't batch)
+def detect_batch(images, profile=None):
+    from insightface.app.common import Face
+
+    face = get_face_analysis(profile)
+    detections = []
+    for img in images:
+        if img is None:
+            detections.append(None)
+            continue
+        with metrics.stage("model", "detection"):
+            bboxes, kpss = face.det_model.detect(img, max_num=0, metric="default")
+        metrics.inference("detection")
+        if bboxes.shape[0] == 0:
+            detections.append(None)
+            continue
+        detections.append(Face(bbox=bboxes[0, 0:4], kps=kpss[0], det_score=bboxes[0, 4]))
+    return detections
+
+
+# Detection + recognition for a batch of frames: the aligned crops of all frames go
+# through the ArcFace model in a single batched call
+def detect_and_embed_batch(images, profile=None):
+    from insightface.utils import face_align
+
+    face = get_face_analysis(profile)
+    detections = detect_batch(images, profile)
+    crops = [face_align.norm_crop(img, landmark=detected.kps, image_size=face.models["recognition"].input_size[0])
+             for img, detected in zip(images, detections) if detected is not None]
+    if crops:
+        with metrics.stage("model", "recognition"):
+            features = iter(face.models["recognition"].get_feat(crops))
+        metrics.inference("recognition", len(crops))
+        for detected in detections:
+            if detected is not None:
+                detected.embedding = next(features).flatten()
+    return detections
+
+
+# Turn a detection into what the later stages need:
+# the InsightFace result (bbox, kps, embedding) and the bbox as (x, y, w, h)
+def build_frame_analysis(img, detected):
+    if detected is None:
+        return None
+
+    img_h, img_w = img.shape[:2]
+    x1, y1, x2, y2 = detected.bbox.astype(int)
+    x1, y1 = max(x1, 0), max(y1, 0)
+    x2, y2 = min(x2, img_w), min(y2, img_h)
+
+    return {
+        "face": detected,
+        "embedding": detected.normed_embedding,
+        "facial_area": (int(x1), int(y1), int(x2 - x1), int(y2 - y1))
+    }
+
+
+# # Function to detect head position using MediaPipe
+def detect_head_position(image, face_landmarks, img_w, img_h):
+    face_3d, face_2d = [], []
+    for idx, lm in enumerate(face_landmarks.landmark):
+        if idx in [33, 263, 1, 61, 291, 199]:
+            x, y = int(lm.x * img_w), int(lm.y * img_h)
+            face_2d.append([x, y])
+            face_3d.append([x, y, lm.z])
+
+    face_2d, face_3d = np.array(face_2d, dtype=np.float64), np.array(face_3d, dtype=np.float64)
+    focal_length = 1 * img_w
+    cam_matrix = np.array([[focal_length, 0, img_h / 2],
+                           [0, focal_length, img_w / 2], [0, 0, 1]])
+    dist_matrix = np.zeros((4, 1), dtype=np.float64)
+    success, rot_vec, trans_vec = cv2.solvePnP(face_3d, face_2d, cam_matrix, dist_matrix)
+    rmat, _ = cv2.Rodrigues(rot_vec)
+    angles, _, _, _, _, _ = cv2.RQDecomp3x3(rmat)
+    x, y, z = angles[0] * 360, angles[1] * 360, angles[2] * 360
+    return x, y, z
+
+
+# Function to check whether user performed correct task or not.
+# FaceMesh runs on the full frame: detect_head_position's camera matrix and the
+# classify_head_position thresholds were tuned for full-frame geometry, and a face crop
+# changes the focal length and principal point the angles are solved against.
+def validate_task(image):
+    img_h, img_w, _ = image.shape
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    with face_mesh_lock, metrics.stage("model", "pose_mediapipe"):
+        results = get_face_mesh().process(rgb_image)
+    metrics.inference("face_mesh")
+
+    if results.multi_face_landmarks:
+        for face_landmarks in results.multi_face_landmarks:
+            x, y, z = detect_head_position(image, face_landmarks, img_w, img_h)
+            return classify_head_position(x, y)
+    return "Unknown"
+
+
+def classify_head_position(x, y):
+    if y < -9:
+        return "Left"
+    elif y > 9:
+        return "Right"
+    elif x > 15:
+        return "Up"
+    return "Front"
+
+
+# InsightFace pose backend (pose_backend=insightface): buffalo_l's 3D-landmark model runs
+# on the face that was already detected and gives (pitch, yaw, roll) in degrees, so no
+# second face detector or 468-point mesh is needed. The thresholds and signs below are
+# placeholders, not yet calibrated: run benchmarks/pose_benchmark.py on a labelled image
+# set and set them from its output before switching the default away from MediaPipe.
+POSE_BACKEND = os.getenv("pose_backend", "mediapipe")
+POSE_YAW_THRESHOLD = float(os.getenv("pose_yaw_threshold", 15))
+POSE_PITCH_THRESHOLD = float(os.getenv("pose_pitch_threshold", 12))
+POSE_YAW_SIGN = float(os.getenv("pose_yaw_sign", 1))
+POSE_PITCH_SIGN = float(os.getenv("pose_pitch_sign", 1))
+
+
+def classify_pose(pitch, yaw, yaw_threshold=POSE_YAW_THRESHOLD, pitch_threshold=POSE_PITCH_THRESHOLD,
+                  yaw_sign=POSE_YAW_SIGN, pitch_sign=POSE_PITCH_SIGN):
+    yaw *= yaw_sign
+    pitch *= pitch_sign
+    if yaw < -yaw_threshold:
+        return "Left"
+    elif yaw > yaw_threshold:
+        return "Right"
+    elif pitch > pitch_threshold:
+        return "Up"
+    return "Front"
+
+
+def insightface_head_position(img, detected, profile=None):
+    landmark_model = get_face_analysis(profile).models.get("landmark_3d_68")
+    if landmark_model is None:
+        return None
+    with metrics.stage("model", "pose_insightface"):
+        landmark_model.get(img, detected)
+    metrics.inference("landmark_3d_68")
+    pitch, yaw, roll = detected.pose
+    return classify_pose(pitch, yaw)
+
+
+# Head position for an analysed frame, using the configured backend. Falls back to
+# MediaPipe when the InsightFace landmark model isn't loaded.
+def estimate_head_position(img, analysis, backend=None, profile=None):
+    if (backend or POSE_BACKEND) == "insightface":
+        position = insightface_head_position(img, analysis["face"], profile)
+        if position is not None:
+            return position
+    return validate_task(img)
+
+
+# Head-position tracking over a frame sequence for one challenge session.
+# Each tracker owns a FaceMesh in video mode, so landmarks are tracked from frame to
+# frame instead of re-running face detection, and reports how long the pose has been held.
+class PoseTracker:
+    def __init__(self, target, hold_frames=5):
+        self.target = target
+        self.hold_frames = hold_frames
+        self.held = 0
+        self.frames = 0
+        self.last_position = "Unknown"
+        import mediapipe as mp
+        self.face_mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1,
+                                                         min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+    def update(self, image):
+        self.frames += 1
+        img_h, img_w, _ = image.shape
+        results = self.face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if results.multi_face_landmarks:
+            x, y, z = detect_head_position(image, results.multi_face_landmarks[0], img_w, img_h)
+            self.last_position = classify_head_position(x, y)
+        else:
+            self.last_position = "Unknown"
+        self.held = self.held + 1 if self.last_position == self.target else 0
+        return self.last_position
+
+    @property
+    def done(self):
+        return self.held >= self.hold_frames
+
+    def close(self):
+        self.face_mesh.close()
+
+
+# Anti-spoofing backend: "onnx" (liveness.LivenessEngine) or "deepface"
+LIVENESS_BACKEND = os.getenv("liveness_backend", "onnx")
+
+
+def deepface_real_score(is_real, confidence):
+    return float(confidence) if is_real else 1 - float(confidence)
+
+
+# Function to check for spoofing. Returns (status, score), where score is P(real) for
+# both backends and status is "Live" when it is above 0.5. DeepFace reports the confidence
+# of whichever class it predicted, so its spoof verdicts are turned into 1 - confidence.
+# If the facial area is already known, no detector is run.
+def check_liveness(img, facial_area=None):
+    metrics.inference("antispoof")
+    try:
+        if facial_area is not None and LIVENESS_BACKEND == "onnx":
+            result = get_liveness_engine().score([(img, facial_area)])["results"][0]
+            return result["status"], result["score"]
+        if facial_area is not None:
+            is_real, confidence = get_antispoof_model().analyze(img=img, facial_area=facial_area)
+        else:
+            from deepface import DeepFace
+            result = DeepFace.extract_faces(img_path=img, detector_backend="opencv", enforce_detection=False, align=False,
+                                            anti_spoofing=True)
+            is_real, confidence = result[0]["is_real"], result[0]["antispoof_score"]
+        real_score = deepface_real_score(is_real, confidence)
+        return ("Live" if real_score > 0.5 else "Spoof"), round(real_score, 4)
+    except Exception as e:
+        print("Liveness detection error:", e)
+    return "Unknown", None
+
+
+# Face-continuity embedding for challenge sessions: a small recognition model (buffalo_s's
+# MobileFaceNet by default) run on the aligned face. It is only compared with embeddings
+# from the same model, so it needn't match the enrolment model.
+CHALLENGE_SESSIONS = os.getenv("challenge_sessions", "true").lower() == "true"
+CONTINUITY_PACK = os.getenv("challenge_continuity_pack", "buffalo_s")
+
+
+def get_continuity_model():
+    return _load("continuity", lambda: _load_recognition_model(CONTINUITY_PACK))
+
+
+# From the five detection landmarks of the face (detected.kps, or check_frame's "landmarks")
+def continuity_embedding(img, landmarks):
+    from insightface.utils import face_align
+
+    model = get_continuity_model()
+    crop = face_align.norm_crop(img, landmark=landmarks, image_size=model.input_size[0])
+    with metrics.stage("model", "continuity"):
+        embedding = model.get_feat([crop]).flatten()
+    metrics.inference("continuity")
+    return embedding / np.linalg.norm(embedding)
+
+
+# Everything /verify needs from one frame: embedding, liveness and head position, plus the
+# landmarks a challenge session's continuity embedding is computed from if the frame passes
+def check_frame(img, detected, profile=None):
+    analysis = build_frame_analysis(img, detected)
+    if analysis is None:
+        return None
+    with metrics.stage("model", "liveness"):
+        liveness_status, liveness_score = check_liveness(img, facial_area=analysis["facial_area"])
+    return {
+        "embedding": analysis["embedding"],
+        "facial_area": analysis["facial_area"],
+        "liveness_status": liveness_status,
+        "liveness_score": liveness_score,
+        "task_result": estimate_head_position(img, analysis, profile=profile),
+        "landmarks": detected.kps
+    }
+
+
+# Later frames of a challenge session: detection, the continuity check against the
+# session's first frame and the pose. No ArcFace embedding, anti-spoofing or Mongo lookup.
+def check_session_frame(img, continuity_reference, profile=None):
+    detected = detect_batch([img], profile)[0]
+    analysis = build_frame_analysis(img, detected)
+    if analysis is None:
+        return None
+    return {
+        "continuity": float(np.dot(continuity_embedding(img, detected.kps), continuity_reference)),
+        "task_result": estimate_head_position(img, analysis, profile=profile)
+    }
+
+
+# Worker-process entry point for ModelWorkerPool, which only serves /verify: a full check,
+# a session check when the session's continuity embedding is passed along, or the
+# continuity embedding for a new session when the frame's landmarks are
+def check_frame_worker(img, continuity_reference=None, landmarks=None):
+    profile = profile_for("verify")
+    if landmarks is not None:
+        return continuity_embedding(img, landmarks)
+    if continuity_reference is not None:
+        return check_session_frame(img, continuity_reference, profile)
+    return check_frame(img, detect_and_embed_batch([img], profile)[0], profile)
+
+
+warm = False
+
+
+# Load every model and push a dummy frame through each stage so the first real
+# request doesn't pay for weight loading or ONNX/TF graph initialisation
+def warm_up():
+    global warm
+    from insightface.app.common import Face
+
+    dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+    for profile in active_profiles():
+        detect_and_embed_batch([dummy], profile)
+        # Nothing is detected on the blank frame, so run the per-face models on a dummy face directly
+        face = get_face_analysis(profile)
+        face.models["recognition"].get_feat([np.zeros((112, 112, 3), dtype=np.uint8)])
+        if "landmark_3d_68" in face.models:
+            face.models["landmark_3d_68"].get(dummy, Face(bbox=np.array([200, 120, 440, 360], dtype=np.float32)))
+    start = time.perf_counter()
+    if LIVENESS_BACKEND == "onnx":
+        get_liveness_engine().score([(dummy, (200, 120, 240, 240))])
+    else:
+        get_antispoof_model().analyze(img=dummy, facial_area=(200, 120, 240, 240))
+    load_times["antispoof_first_inference"] = round(time.perf_counter() - start, 3)
+    validate_task(dummy)
+    if CHALLENGE_SESSIONS:
+        get_continuity_model().get_feat([np.zeros((112, 112, 3), dtype=np.uint8)])
+    warm = True
+    return dict(load_times)
+
+
+def model_status():
+    status = {"warm": warm, "loaded": sorted(_models), "load_times": dict(load_times)}
+    if "liveness_engine" in _models:
+        status["liveness"] = _models["liveness_engine"].stats()
+    return status
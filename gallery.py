@@ -0,0 +1,116 @@
+import threading
+import numpy as np
+from bson import ObjectId
+from embedding_codec import decode_embedding
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+# In-memory 1:N gallery of enrolled embeddings.
+# Embeddings live in one contiguous float32 matrix (rows are unit vectors) so a
+# query is a single matrix-vector product. If hnswlib is installed and the gallery
+# grows past ann_threshold, queries go through an HNSW index instead.
+class FaceGallery:
+    def __init__(self, dim=512, initial_capacity=1024, ann_threshold=50000, ef_search=64):
+        self.dim = dim
+        self.ann_threshold = ann_threshold
+        self.ef_search = ef_search
+        self._matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self._emails = []
+        self._rows = {}
+        self._ann = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._emails)
+
+    @staticmethod
+    def _normalize(embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms
+
+    def _grow(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self._emails)] = self._matrix[:len(self._emails)]
+        self._matrix = matrix
+
+    # Bulk load, used when building from the Users collection
+    def add_many(self, emails, embeddings):
+        if len(emails) == 0:
+            return
+        vectors = self._normalize(embeddings).reshape(len(emails), self.dim)
+        with self._lock:
+            new_rows = []
+            for email, vector in zip(emails, vectors):
+                row = self._rows.get(email)
+                if row is None:
+                    row = len(self._emails)
+                    self._grow(row + 1)
+                    self._emails.append(email)
+                    self._rows[email] = row
+                    new_rows.append(row)
+                self._matrix[row] = vector
+            self._update_ann(new_rows)
+
+    def add(self, email, embedding):
+        self.add_many([email], [embedding])
+
+    def _update_ann(self, new_rows):
+        if hnswlib is None or len(self._emails) < self.ann_threshold:
+            return
+        if self._ann is None:
+            self._ann = hnswlib.Index(space="ip", dim=self.dim)
+            self._ann.init_index(max_elements=self._matrix.shape[0], ef_construction=200, M=16)
+            self._ann.set_ef(self.ef_search)
+            new_rows = range(len(self._emails))
+        elif self._ann.get_max_elements() < self._matrix.shape[0]:
+            self._ann.resize_index(self._matrix.shape[0])
+        rows = np.fromiter(new_rows, dtype=np.int64)
+        if len(rows):
+            self._ann.add_items(self._matrix[rows], rows)
+
+    def search(self, embedding, k=5):
+        query = self._normalize(embedding).reshape(self.dim)
+        with self._lock:
+            n = len(self._emails)
+            if n == 0:
+                return []
+            k = min(k, n)
+            if self._ann is not None:
+                rows, distances = self._ann.knn_query(query, k=k)
+                rows, scores = rows[0], 1 - distances[0]
+            else:
+                scores = self._matrix[:n] @ query
+                if k < n:
+                    rows = np.argpartition(-scores, k - 1)[:k]
+                else:
+                    rows = np.arange(n)
+                rows = rows[np.argsort(-scores[rows])]
+                scores = scores[rows]
+            return [(self._emails[row], float(score)) for row, score in zip(rows, scores)]
+
+    # Build gallery from the Users collection, fetching only the fields we need.
+    # With since (a UTC datetime) only users whose _id was generated after it are read;
+    # users already in the gallery are simply overwritten.
+    def load_from_collection(self, collection, batch_size=5000, since=None):
+        query = {"face_embedding": {"$exists": True}}
+        if since is not None:
+            query["_id"] = {"$gte": ObjectId.from_datetime(since)}
+        emails, embeddings = [], []
+        for user in collection.find(query, {"email": 1, "face_embedding": 1, "_id": 0}).batch_size(batch_size):
+            emails.append(user["email"])
+            embeddings.append(decode_embedding(user["face_embedding"]))
+            if len(emails) >= batch_size:
+                self.add_many(emails, embeddings)
+                emails, embeddings = [], []
+        self.add_many(emails, embeddings)
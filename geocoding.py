@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+UNKNOWN_LOCATION = {"city": "Unknown", "state": "Unknown", "country": "Unknown"}
+
+
+# Reverse geocoder with a grid-cell cache in front of bigdatacloud.
+# Coordinates are snapped to cells of `precision` decimal places (2 -> roughly 1 km), so
+# nearby logins share one lookup. Results live in a bounded in-memory LRU and, if
+# cache_path is set, in a small SQLite table that survives restarts.
+# Failed or timed-out lookups return UNKNOWN_LOCATION and are not cached.
+class Geocoder:
+    def __init__(self, base_url="https://api.bigdatacloud.net/data/reverse-geocode-client", timeout=2.0,
+                 precision=2, max_size=10000, cache_path=None, background_workers=4):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.precision = precision
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self._session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self._executor = ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix="geocode")
+        self._db = None
+        if cache_path:
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS locations (cell TEXT PRIMARY KEY, location TEXT)")
+            self._db.commit()
+
+    def cell(self, latitude, longitude):
+        return f"{round(float(latitude), self.precision)},{round(float(longitude), self.precision)}"
+
+    # Cache-only lookup, never goes to the network
+    def cached(self, latitude, longitude):
+        key = self.cell(latitude, longitude)
+        with self._lock:
+            location = self._cache.get(key)
+            if location is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return location
+            if self._db is not None:
+                row = self._db.execute("SELECT location FROM locations WHERE cell = ?", (key,)).fetchone()
+                if row:
+                    location = json.loads(row[0])
+                    self._remember(key, location)
+                    self.hits += 1
+                    return location
+        return None
+
+    def _remember(self, key, location):
+        self._cache[key] = location
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _fetch(self, latitude, longitude):
+        try:
+            response = self._session.get(self.base_url, timeout=self.timeout, params={
+                "latitude": latitude, "longitude": longitude, "localityLanguage": "en"})
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print("Geocoding error:", e)
+            self.errors += 1
+            return None
+        return self._parse(data)
+
+    @staticmethod
+    def _parse(data):
+        if "locality" in data:
+            return {
+                "city": data.get('city', 'Unknown'),
+                "state": data.get('principalSubdivision', 'Unknown'),
+                "country": data.get('countryName', 'Unknown')
+            }
+        return dict(UNKNOWN_LOCATION)
+
+    def lookup(self, latitude, longitude):
+        location = self.cached(latitude, longitude)
+        if location is not None:
+            return location
+
+        self.misses += 1
+        location = self._fetch(latitude, longitude)
+        if location is None:
+            return dict(UNKNOWN_LOCATION)
+        self._store(latitude, longitude, location)
+        return location
+
+    def _store(self, latitude, longitude, location):
+        key = self.cell(latitude, longitude)
+        with self._lock:
+            self._remember(key, location)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO locations VALUES (?, ?)", (key, json.dumps(location)))
+                self._db.commit()
+
+    # Same as lookup, for the event loop: misses go through an httpx.AsyncClient owned by the caller
+    async def lookup_async(self, latitude, longitude, client):
+        location = self.cached(latitude, longitude)
+        if location is not None:
+            return location
+
+        self.misses += 1
+        try:
+            response = await client.get(self.base_url, timeout=self.timeout, params={
+                "latitude": latitude, "longitude": longitude, "localityLanguage": "en"})
+            location = self._parse(response.json())
+        except Exception as e:
+            print("Geocoding error:", e)
+            self.errors += 1
+            return dict(UNKNOWN_LOCATION)
+        self._store(latitude, longitude, location)
+        return location
+
+    # Resolve in the background and hand the result to callback(location)
+    def lookup_deferred(self, latitude, longitude, callback):
+        def run():
+            try:
+                callback(self.lookup(latitude, longitude))
+            except Exception as e:
+                print("Deferred geocoding error:", e)
+        return self._executor.submit(run)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+def geocoder_from_env():
+    return Geocoder(
+        base_url=os.getenv("geocode_url", "https://api.bigdatacloud.net/data/reverse-geocode-client"),
+        timeout=float(os.getenv("geocode_timeout", 2)),
+        precision=int(os.getenv("geocode_precision", 2)),
+        max_size=int(os.getenv("geocode_cache_size", 10000)),
+        cache_path=os.getenv("geocode_cache_path")
+    )
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Face images live outside the Users collection, in one of these stores. Both take a
+# key and raw bytes and return a URL the image can be fetched from later.
+class FilesystemImageStore:
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def put(self, key, data):
+        path = os.path.realpath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Image key {key!r} resolves outside the image store")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return "file://" + os.path.abspath(path)
+
+
+# Works against Azure and against the Azurite emulator (via its connection string)
+class AzureBlobImageStore:
+    def __init__(self, connection_string, container_name):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self._container = None
+
+    def container(self):
+        if self._container is None:
+            from azure.storage.blob import BlobServiceClient
+            service = BlobServiceClient.from_connection_string(self.connection_string)
+            self._container = service.get_container_client(self.container_name)
+        return self._container
+
+    def put(self, key, data):
+        blob_client = self.container().get_blob_client(key)
+        blob_client.upload_blob(data, overwrite=True)
+        return blob_client.url
+
+
+# Uploads images in the background with bounded concurrency and retries.
+# At most max_pending uploads are held in memory; past that, upload() blocks the caller.
+# on_done(url) runs after a successful upload, on_failed(error) after the last retry fails.
+class AsyncImageUploader:
+    def __init__(self, store, max_workers=4, max_pending=100, max_retries=3, backoff=0.5):
+        self.store = store
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.uploaded = 0
+        self.failed = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-upload")
+
+    def _run(self, key, data, on_done, on_failed):
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    url = self.store.put(key, data)
+                    self.uploaded += 1
+                    if on_done is not None:
+                        on_done(url)
+                    return url
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        self.failed += 1
+                        print(f"Image upload failed for {key}:", e)
+                        if on_failed is not None:
+                            on_failed(e)
+                        return None
+                    time.sleep(self.backoff * 2 ** attempt)
+        finally:
+            self._slots.release()
+
+    def upload(self, key, data, on_done=None, on_failed=None):
+        self._slots.acquire()
+        return self._executor.submit(self._run, key, data, on_done, on_failed)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {"uploaded": self.uploaded, "failed": self.failed}
+
+
+def image_store_from_env():
+    if os.getenv("image_store", "azure") == "filesystem":
+        return FilesystemImageStore(os.getenv("image_store_path", "images"))
+    return AzureBlobImageStore(os.getenv("azure_string"), os.getenv("container"))
+
+
+# Keyed by a hash of the email, so a client-supplied email can't steer the path or blob name.
+# Existing users keep the key recorded in their user_image_key field.
+def user_image_key(email):
+    return f"{hashlib.sha256(email.encode()).hexdigest()}/front.jpeg"
+
+
+# Upload a user's front image in the background and record the URL on the user document
+def store_user_image(uploader, users, email, data):
+    return uploader.upload(
+        user_image_key(email), data,
+        on_done=lambda url: users.update_one({"email": email},
+                                             {"$set": {"user_image_url": url, "user_image_status": "stored"}}),
+        on_failed=lambda error: users.update_one({"email": email}, {"$set": {"user_image_status": "failed"}})
+    )
+
+
+# Move user_image blobs that are still embedded in Users documents out to the image store.
+# Usage: python image_store.py migrate
+def migrate(users, uploader):
+    moved = 0
+    for user in users.find({"user_image": {"$exists": True}}, {"email": 1, "user_image": 1}):
+        email = user["email"]
+
+        def unset_blob(url, email=email):
+            users.update_one({"email": email}, {"$set": {"user_image_url": url, "user_image_status": "stored"},
+                                                "$unset": {"user_image": ""}})
+        key = user_image_key(email)
+        users.update_one({"_id": user["_id"]}, {"$set": {"user_image_key": key}})
+        uploader.upload(key, bytes(user["user_image"]), on_done=unset_blob)
+        moved += 1
+    uploader.close()
+    return moved
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        print("Usage: python image_store.py migrate")
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    users = MongoClient(os.getenv("mongo_URI"))['Liveliness']['Users']
+    uploader = AsyncImageUploader(image_store_from_env())
+    print("Moved", migrate(users, uploader), "images;", uploader.stats())
@@ -0,0 +1,86 @@
+import base64
+import binascii
+import os
+import numpy as np
+import cv2
+
+MAX_IMAGE_BYTES = int(os.getenv("max_image_bytes", 8 * 1024 * 1024))
+DECODE_TARGET_SIZE = int(os.getenv("decode_target_size", 640))
+
+REDUCED_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+# Read width/height from a JPEG's SOF header without decoding it
+def jpeg_size(data):
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + length
+    return None
+
+
+# Decode image bytes straight from memory. Large JPEGs are decoded at 1/2, 1/4 or 1/8
+# scale by libjpeg itself, picking the largest reduction that still keeps the long side
+# at or above the detector input size. max_bytes=None skips the upload size limit (local files).
+def decode_frame(data, target_size=DECODE_TARGET_SIZE, max_bytes=MAX_IMAGE_BYTES):
+    if max_bytes is not None and len(data) > max_bytes:
+        raise ImageTooLarge(f"Image of {len(data)} bytes exceeds limit of {max_bytes} bytes")
+
+    flag = cv2.IMREAD_COLOR
+    size = jpeg_size(data)
+    if size is not None:
+        for factor, reduced_flag in REDUCED_FLAGS:
+            if max(size) // factor >= target_size:
+                flag = reduced_flag
+                break
+
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+
+
+# Image bytes from a data URL or bare base64 string; oversized payloads are rejected
+# from the encoded length, before anything is decoded
+def decode_data_url(value):
+    if isinstance(value, str):
+        value = value.encode()
+    payload = value.split(b",", 1)[-1]
+    if len(payload) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"Image payload exceeds limit of {MAX_IMAGE_BYTES} bytes")
+    try:
+        return base64.b64decode(payload)
+    except (binascii.Error, ValueError):
+        return None
+
+
+# Raw bytes for an image field of the current request: either a binary multipart
+# upload (request.files) or a data URL / base64 form value
+def read_image_field(request, field):
+    upload = request.files.get(field)
+    if upload is not None:
+        data = upload.stream.read(MAX_IMAGE_BYTES + 1)
+        if len(data) > MAX_IMAGE_BYTES:
+            raise ImageTooLarge(f"Image upload exceeds limit of {MAX_IMAGE_BYTES} bytes")
+        return data
+
+    value = request.form.get(field)
+    if not value:
+        return None
+    return decode_data_url(value)
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import numpy as np
+import cv2
+
+# Anti-spoofing on ONNX Runtime. DeepFace's Fasnet is two MiniFASNet models that look at
+# the face at 2.7x and 4x context; here both are exported into one ONNX graph that takes
+# the two 80x80 crops and returns the averaged softmax, and that graph is loaded once into
+# a CPU session with explicit threading. Class 1 of the softmax is "real".
+ANTISPOOF_ONNX_PATH = os.getenv("antispoof_onnx_path", os.path.join("models", "fasnet.onnx"))
+LIVENESS_THRESHOLD = 0.5
+CROP_SCALES = (2.7, 4.0)
+CROP_SIZE = 80
+
+
+# Same box expansion as DeepFace's Fasnet: scale the face box around its centre, shifted
+# back inside the image where it would cross an edge
+def _scaled_box(src_w, src_h, facial_area, scale):
+    x, y, box_w, box_h = facial_area
+    scale = min((src_h - 1) / box_h, (src_w - 1) / box_w, scale)
+    new_w, new_h = box_w * scale, box_h * scale
+    center_x, center_y = box_w / 2 + x, box_h / 2 + y
+    x1, y1 = center_x - new_w / 2, center_y - new_h / 2
+    x2, y2 = center_x + new_w / 2, center_y + new_h / 2
+    if x1 < 0:
+        x2 -= x1
+        x1 = 0
+    if y1 < 0:
+        y2 -= y1
+        y1 = 0
+    if x2 > src_w - 1:
+        x1 -= x2 - src_w + 1
+        x2 = src_w - 1
+    if y2 > src_h - 1:
+        y1 -= y2 - src_h + 1
+        y2 = src_h - 1
+    return int(x1), int(y1), int(x2), int(y2)
+
+
+# The two model inputs for a face, as float32 CHW arrays (BGR, 0-255, like DeepFace)
+def crop_face(img, facial_area):
+    src_h, src_w = img.shape[:2]
+    crops = []
+    for scale in CROP_SCALES:
+        x1, y1, x2, y2 = _scaled_box(src_w, src_h, facial_area, scale)
+        crop = cv2.resize(img[y1:y2 + 1, x1:x2 + 1], (CROP_SIZE, CROP_SIZE))
+        crops.append(crop.transpose(2, 0, 1).astype(np.float32))
+    return crops
+
+
+# Export DeepFace's Fasnet weights as a single ONNX graph with a dynamic batch axis
+def export_fasnet_onnx(path=ANTISPOOF_ONNX_PATH):
+    import torch
+    from deepface.modules import modeling
+
+    fasnet = modeling.build_model(task="spoofing", model_name="Fasnet")
+
+    class FasnetEnsemble(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.first_model = fasnet.first_model.cpu().eval()
+            self.second_model = fasnet.second_model.cpu().eval()
+
+        def forward(self, first, second):
+            return (torch.softmax(self.first_model(first), dim=1)
+                    + torch.softmax(self.second_model(second), dim=1)) / 2
+
+    # Export to a per-process temp file and rename it into place, so model workers that
+    # export at the same time never load a half-written file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    dummy = torch.zeros(1, 3, CROP_SIZE, CROP_SIZE)
+    try:
+        torch.onnx.export(FasnetEnsemble(), (dummy, dummy), tmp_path, input_names=["first", "second"],
+                          output_names=["probabilities"], opset_version=13,
+                          dynamic_axes={"first": {0: "batch"}, "second": {0: "batch"}, "probabilities": {0: "batch"}})
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+# One ONNX Runtime session shared by every caller (session.run is thread-safe).
+# intra_threads parallelises a single inference; inter_threads only matters for parallel
+# graph execution, which this small sequential graph doesn't use. The score is
+# P(real), optionally Platt-scaled with calibration=(a, b): sigmoid(a * logit(p) + b).
+class LivenessEngine:
+    def __init__(self, model_path=ANTISPOOF_ONNX_PATH, intra_threads=2, inter_threads=1,
+                 calibration=(1.0, 0.0), threshold=LIVENESS_THRESHOLD):
+        import onnxruntime as ort
+
+        if not os.path.exists(model_path):
+            export_fasnet_onnx(model_path)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.calibration = calibration
+        self.threshold = threshold
+        self.calls = 0
+        self.faces = 0
+        self.total_ms = 0.0
+
+    def calibrate(self, probabilities):
+        a, b = self.calibration
+        if (a, b) == (1.0, 0.0):
+            return probabilities
+        p = np.clip(probabilities, 1e-6, 1 - 1e-6)
+        return 1 / (1 + np.exp(-(a * np.log(p / (1 - p)) + b)))
+
+    # Score pre-cropped inputs from crop_face: first and second are lists (or N x 3 x 80 x 80
+    # arrays) of the 2.7x and 4x crops
+    def score_crops(self, first, second):
+        start = time.perf_counter()
+        probabilities = self.session.run(None, {"first": np.ascontiguousarray(first, dtype=np.float32),
+                                                "second": np.ascontiguousarray(second, dtype=np.float32)})[0]
+        scores = self.calibrate(probabilities[:, 1])
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.calls += 1
+        self.faces += len(scores)
+        self.total_ms += latency_ms
+        return {
+            "results": [{"status": "Live" if score > self.threshold else "Spoof", "score": round(float(score), 4)}
+                        for score in scores],
+            "latency_ms": round(latency_ms, 2)
+        }
+
+    # Score a batch of (image, facial_area) pairs, facial_area as (x, y, w, h)
+    def score(self, faces):
+        if not faces:
+            return {"results": [], "latency_ms": 0.0}
+        crops = [crop_face(img, facial_area) for img, facial_area in faces]
+        return self.score_crops([c[0] for c in crops], [c[1] for c in crops])
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "faces": self.faces,
+            "avg_latency_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0
+        }
+
+
+def liveness_engine_from_env():
+    calibration = tuple(float(v) for v in os.getenv("liveness_calibration", "1,0").split(","))
+    return LivenessEngine(intra_threads=int(os.getenv("liveness_intra_threads", 2)),
+                          inter_threads=int(os.getenv("liveness_inter_threads", 1)),
+                          calibration=calibration)
+
+
+# Usage: python liveness.py export [path]
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["export"]:
+        print("Usage: python liveness.py export [path]")
+        sys.exit(1)
+    print("Wrote", export_fasnet_onnx(*sys.argv[2:3]))
@@ -0,0 +1,354 @@
+import base64
+import datetime
+import gzip
+import os
+import re
+import sys
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from schema import LOG_INDEXES, create_indexes
+
+BUCKET_PATTERN = re.compile(r"^Logs_(\d{4})_(\d{2})$")
+
+
+def month_start(timestamp):
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+
+# ----------------- Query helpers -----------------
+# The /get-logs and dashboard log queries, shared by api.py and the query plan checks in schema.py
+LOG_ORDER = [("timestamp", -1), ("_id", -1)]
+
+
+def encode_log_cursor(log):
+    return base64.urlsafe_b64encode(f"{log['timestamp'].isoformat()}|{log['_id']}".encode()).decode()
+
+
+def decode_log_cursor(cursor):
+    timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    if not ObjectId.is_valid(log_id):
+        raise ValueError(f"Invalid log id {log_id}")
+    return parse_log_time(timestamp), ObjectId(log_id)
+
+
+# Logs are stored with naive local timestamps; an offset-aware start/end is converted to
+# local time so it compares with them (and with the naive log bucket windows)
+def parse_log_time(value):
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+# Mongo filter for /get-logs from the email, status, start, end and cursor query params,
+# plus the [start, end) time window it covers (None when unbounded) so the log store only
+# reads the buckets in that window
+def build_log_query(args):
+    query = {}
+    start = end = None
+    if args.get("email"):
+        query["email"] = args["email"]
+    if args.get("status"):
+        query["status"] = args["status"]
+    if args.get("start") or args.get("end"):
+        query["timestamp"] = {}
+        if args.get("start"):
+            start = query["timestamp"]["$gte"] = parse_log_time(args["start"])
+        if args.get("end"):
+            end = query["timestamp"]["$lt"] = parse_log_time(args["end"])
+    if args.get("cursor"):
+        timestamp, log_id = decode_log_cursor(args["cursor"])
+        query = {"$and": [query, {"$or": [{"timestamp": {"$lt": timestamp}},
+                                          {"timestamp": timestamp, "_id": {"$lt": log_id}}]}]}
+        # Inclusive of the cursor's timestamp, which the next page's logs may share
+        cursor_end = timestamp + datetime.timedelta(microseconds=1)
+        end = min(end, cursor_end) if end else cursor_end
+    return query, start, end
+
+
+# Users with the most rejected logs since start (all time when None), top 4
+def top_rejected_pipeline(start=None):
+    match = {"status": "Rejected"}
+    if start is not None:
+        match["timestamp"] = {"$gte": start}
+    return [
+        {"$match": match},
+        {"$group": {"_id": "$email", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": 4}
+    ]
+
+
+# Access layer for the audit log (login attempts, registrations, verifications).
+#   log_storage=single:  everything in the Logs collection, as before
+#   log_storage=monthly: one collection per calendar month of the log's timestamp (Logs_YYYY_MM),
+#                        so reads bounded by a time window only touch the months in that window
+# Both modes keep the same indexes on every collection, and with retention_days > 0 a TTL
+# index on timestamp lets Mongo expire old logs. The dashboard counters live in the
+# rollups, so expiring or archiving logs doesn't change them.
+class LogStore:
+    def __init__(self, db, mode="single", retention_days=0):
+        if mode not in ("single", "monthly"):
+            raise ValueError(f"Unknown log_storage {mode}")
+        self.db = db
+        self.mode = mode
+        self.retention_days = retention_days
+        self._indexed = set()
+
+    def bucket_name(self, timestamp):
+        return "Logs" if self.mode == "single" else timestamp.strftime("Logs_%Y_%m")
+
+    def collection_for(self, timestamp):
+        return self.db[self.bucket_name(timestamp)]
+
+    @staticmethod
+    def _bucket_window(name):
+        year, month = BUCKET_PATTERN.match(name).groups()
+        start = datetime.datetime(int(year), int(month), 1)
+        return start, next_month(start)
+
+    # Bucket names overlapping [start, end), newest first; None means unbounded
+    @classmethod
+    def _select_buckets(cls, names, start=None, end=None):
+        selected = []
+        for name in names:
+            if not BUCKET_PATTERN.match(name):
+                continue
+            bucket_start, bucket_end = cls._bucket_window(name)
+            if (start is None or bucket_end > start) and (end is None or bucket_start < end):
+                selected.append(name)
+        return sorted(selected, reverse=True)
+
+    def bucket_names(self, start=None, end=None):
+        if self.mode == "single":
+            return ["Logs"]
+        return self._select_buckets(self.db.list_collection_names(), start, end)
+
+    def collections(self, start=None, end=None):
+        return [self.db[name] for name in self.bucket_names(start, end)]
+
+    def _indexes(self):
+        indexes = list(LOG_INDEXES)
+        if self.retention_days > 0:
+            # Changing log_retention_days later needs a collMod on existing buckets
+            indexes.append(([("timestamp", 1)], {"expireAfterSeconds": int(self.retention_days * 86400)}))
+        return indexes
+
+    # Indexes on every existing bucket plus the current one
+    def ensure_indexes(self):
+        names = set(self.bucket_names()) | {self.bucket_name(datetime.datetime.now())}
+        created = []
+        for name in sorted(names):
+            created.extend(create_indexes(self.db[name], self._indexes()))
+            self._indexed.add(name)
+        return created
+
+    # A month's bucket gets its indexes the first time this process writes to it
+    def _bucket_for_write(self, timestamp):
+        name = self.bucket_name(timestamp)
+        if name not in self._indexed:
+            create_indexes(self.db[name], self._indexes())
+            self._indexed.add(name)
+        return self.db[name]
+
+    def _group_by_bucket(self, logs):
+        groups = {}
+        for index, log in enumerate(logs):
+            groups.setdefault(self.bucket_name(log["timestamp"]), []).append((index, log))
+        return groups
+
+    # ----------------- Writers -----------------
+    def insert_one(self, log):
+        return self._bucket_for_write(log["timestamp"]).insert_one(log)
+
+    # Same contract as Collection.insert_many(ordered=False), which AuditLogWriter relies on:
+    # a BulkWriteError reports writeErrors by index into the logs passed in
+    def insert_many(self, logs, ordered=False):
+        write_errors = []
+        for group in self._group_by_bucket(logs).values():
+            try:
+                self._bucket_for_write(group[0][1]["timestamp"]).insert_many([log for _, log in group],
+                                                                             ordered=ordered)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    write_errors.append(dict(error, index=group[error["index"]][0]))
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors})
+
+    def update_location(self, log_id, timestamp, location):
+        self.collection_for(timestamp).update_one({"_id": log_id}, {"$set": {"location": location}})
+
+    # /log-verification: rewrite the user's log (newest bucket first) and return it as it
+    # was. An update that moves the timestamp into another month moves the log too.
+    def find_one_and_update(self, query, update):
+        for collection in self.collections():
+            before = collection.find_one_and_update(query, {"$set": update})
+            if before is None:
+                continue
+            target = self.bucket_name(update.get("timestamp", before["timestamp"]))
+            if target != collection.name:
+                self._bucket_for_write(update["timestamp"]).insert_one(dict(before, **update))
+                collection.delete_one({"_id": before["_id"]})
+            return before
+        return None
+
+    # ----------------- Readers -----------------
+    # Logs matching query with timestamps in [start, end), newest first. Only the buckets
+    # overlapping the window are read, one after another, until limit logs were returned.
+    def find(self, query, projection=None, start=None, end=None, limit=0, batch_size=100):
+        returned = 0
+        for collection in self.collections(start, end):
+            cursor = collection.find(query, projection).sort(LOG_ORDER)
+            if limit:
+                cursor = cursor.limit(limit - returned)
+            for log in cursor.batch_size(batch_size):
+                yield log
+                returned += 1
+            if limit and returned >= limit:
+                return
+
+    # Aggregation over the buckets in [start, end). The pipeline's leading $match runs in each
+    # bucket and the matches are combined with $unionWith before the remaining stages.
+    def _union_pipeline(self, names, pipeline):
+        head = pipeline[:1] if pipeline and "$match" in pipeline[0] else []
+        unions = [{"$unionWith": {"coll": name, "pipeline": head}} for name in names[1:]]
+        return head + unions + pipeline[len(head):]
+
+    def aggregate(self, pipeline, start=None, end=None, **kwargs):
+        names = self.bucket_names(start, end)
+        if not names:
+            return iter([])
+        return self.db[names[0]].aggregate(self._union_pipeline(names, pipeline), **kwargs)
+
+    # ----------------- Archival -----------------
+    # Write every log of each whole month before `before` to <directory>/Logs_YYYY_MM.jsonl.gz
+    # (canonical extended JSON, one log per line), then drop the monthly bucket or, in single
+    # mode, delete that month from Logs. A month whose archive file already exists is skipped.
+    def archive(self, directory, before):
+        from bson import json_util
+
+        os.makedirs(directory, exist_ok=True)
+        archived = {}
+        for name, collection, query in self._archivable_months(before):
+            path = os.path.join(directory, name + ".jsonl.gz")
+            if os.path.exists(path):
+                print(f"Skipping {name}: {path} already exists")
+                continue
+            expected = collection.count_documents(query)
+            if not expected:
+                continue
+            written = 0
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                for log in collection.find(query).sort("_id", 1):
+                    f.write(json_util.dumps(log, json_options=json_util.CANONICAL_JSON_OPTIONS) + "\n")
+                    written += 1
+            if written != expected:
+                os.remove(path + ".tmp")
+                print(f"Skipping {name}: wrote {written} of {expected} logs")
+                continue
+            os.replace(path + ".tmp", path)
+            if self.mode == "single":
+                collection.delete_many(query)
+            else:
+                collection.drop()
+                self._indexed.discard(name)
+            archived[name] = written
+        return archived
+
+    def _archivable_months(self, before):
+        cutoff = month_start(before)
+        if self.mode == "monthly":
+            for name in reversed(self.bucket_names(end=cutoff)):
+                if self._bucket_window(name)[1] <= cutoff:
+                    yield name, self.db[name], {}
+            return
+
+        logs = self.db["Logs"]
+        oldest = logs.find_one({"timestamp": {"$type": "date"}}, {"timestamp": 1}, sort=[("timestamp", 1)])
+        if oldest is None:
+            return
+        start = month_start(oldest["timestamp"])
+        while start < cutoff:
+            end = next_month(start)
+            yield start.strftime("Logs_%Y_%m"), logs, {"timestamp": {"$gte": start, "$lt": end}}
+            start = end
+
+    # Copy the logs of the single Logs collection into monthly buckets (to switch modes)
+    def migrate_to_monthly(self, source, batch_size=5000):
+        moved = 0
+        batch = []
+        for log in source.find({"timestamp": {"$type": "date"}}).batch_size(batch_size):
+            batch.append(log)
+            if len(batch) >= batch_size:
+                moved += self._copy_batch(batch)
+                batch = []
+        if batch:
+            moved += self._copy_batch(batch)
+        return moved
+
+    def _copy_batch(self, batch):
+        try:
+            self.insert_many(batch)
+        except BulkWriteError as e:
+            # Duplicate _ids from an earlier, interrupted run are already copied
+            failed = [error for error in e.details["writeErrors"] if error.get("code") != 11000]
+            if failed:
+                raise
+        return len(batch)
+
+
+# Motor version for the async serving mode (asgi.py), covering the writes its routes make
+class AsyncLogStore(LogStore):
+    async def _bucket_for_write(self, timestamp):
+        name = self.bucket_name(timestamp)
+        if name not in self._indexed:
+            for keys, options in self._indexes():
+                try:
+                    await self.db[name].create_index(keys, **options)
+                except Exception as e:
+                    print(f"Could not create index {keys} on {name}: {e}")
+            self._indexed.add(name)
+        return self.db[name]
+
+    async def insert_one(self, log):
+        return await (await self._bucket_for_write(log["timestamp"])).insert_one(log)
+
+    async def update_location(self, log_id, timestamp, location):
+        await self.collection_for(timestamp).update_one({"_id": log_id}, {"$set": {"location": location}})
+
+
+def log_store_from_env(db, store_class=LogStore):
+    return store_class(db, mode=os.getenv("log_storage", "single"),
+                       retention_days=float(os.getenv("log_retention_days", 0)))
+
+
+# Usage: python log_store.py archive [--older-than-days 90]
+#        python log_store.py migrate     (copy Logs into monthly buckets before setting log_storage=monthly)
+# Archives go to log_archive_dir (default ./log_archive); only whole months older than the
+# cut-off are archived.
+if __name__ == "__main__":
+    if sys.argv[1:2] not in (["archive"], ["migrate"]):
+        print("Usage: python log_store.py archive [--older-than-days N] | migrate")
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    db = MongoClient(os.getenv("mongo_URI"))['Liveliness']
+    if sys.argv[1] == "migrate":
+        store = LogStore(db, mode="monthly")
+        print("Copied", store.migrate_to_monthly(db["Logs"]), "logs into", ", ".join(store.bucket_names()))
+        store.ensure_indexes()
+        sys.exit(0)
+
+    days = int(os.getenv("log_archive_after_days", 90))
+    if "--older-than-days" in sys.argv:
+        days = int(sys.argv[sys.argv.index("--older-than-days") + 1])
+    store = log_store_from_env(db)
+    before = datetime.datetime.now() - datetime.timedelta(days=days)
+    print(store.archive(os.getenv("log_archive_dir", "log_archive"), before))
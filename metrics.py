@@ -0,0 +1,192 @@
+import sys
+import threading
+import time
+from collections import Counter
+from batcher import Histogram
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-second model calls
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Times one block into stage_duration_seconds{route, stage}
+class _StageTimer:
+    __slots__ = ("registry", "labels", "start")
+
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry._observe("stage_duration_seconds", self.labels, time.perf_counter() - self.start)
+
+
+# Process-wide counters and latency histograms, rendered in the Prometheus text format.
+# Recording is a dict lookup plus a short lock, so it stays on in production.
+# Collectors are callables run at scrape time that return (name, type, help, labels, value)
+# tuples, for values owned by other objects (cache stats, queue depths).
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {
+            "stage_duration_seconds": ("histogram", "Time spent in one stage of a request"),
+            "http_request_duration_seconds": ("histogram", "Request latency by route"),
+            "http_requests_total": ("counter", "Requests by route and status code"),
+            "mongo_command_duration_seconds": ("histogram", "Mongo command latency by command and collection"),
+            "mongo_command_failures_total": ("counter", "Failed Mongo commands"),
+            "model_inferences_total": ("counter", "Model invocations by model"),
+            "model_inference_items_total": ("counter", "Faces or frames processed by model"),
+        }
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _observe(self, name, labels, value):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(LATENCY_BUCKETS))
+        histogram.observe(value)
+
+    def observe(self, name, value, **labels):
+        self._observe(name, tuple(sorted(labels.items())), value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def stage(self, route, stage):
+        return _StageTimer(self, (("route", route), ("stage", stage)))
+
+    def inference(self, model, items=1):
+        self.inc("model_inferences_total", model=model)
+        self.inc("model_inference_items_total", items, model=model)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        families = {}
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+
+        for (name, labels), histogram in histograms:
+            bounds, counts, total_sum, total = histogram.cumulative()
+            lines = families.setdefault(name, [])
+            for bound, count in zip(bounds, counts):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total_sum}")
+            lines.append(f"{name}_count{_label_text(labels)} {total}")
+
+        for (name, labels), value in counters:
+            families.setdefault(name, []).append(f"{name}{_label_text(labels)} {value}")
+
+        for collector in self._collectors:
+            try:
+                for name, kind, help_text, labels, value in collector():
+                    self._help.setdefault(name, (kind, help_text))
+                    families.setdefault(name, []).append(
+                        f"{name}{_label_text(tuple(sorted(labels.items())))} {value}")
+            except Exception as e:
+                print("Metrics collector error:", e)
+
+        output = []
+        for name in sorted(families):
+            kind, help_text = self._help.get(name, ("untyped", name))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(families[name])
+        return "\n".join(output) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# pymongo command listener feeding mongo_command_duration_seconds; pass the result to
+# MongoClient(event_listeners=[...])
+def mongo_command_listener(registry=registry):
+    from pymongo import monitoring
+
+    class CommandTimer(monitoring.CommandListener):
+        def __init__(self):
+            self._collections = {}
+
+        def started(self, event):
+            collection = event.command.get(event.command_name)
+            self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+        def succeeded(self, event):
+            collection = self._collections.pop(event.request_id, "")
+            registry.observe("mongo_command_duration_seconds", event.duration_micros / 1e6,
+                             command=event.command_name, collection=collection)
+
+        def failed(self, event):
+            collection = self._collections.pop(event.request_id, "")
+            registry.observe("mongo_command_duration_seconds", event.duration_micros / 1e6,
+                             command=event.command_name, collection=collection)
+            registry.inc("mongo_command_failures_total", command=event.command_name, collection=collection)
+
+    return CommandTimer()
+
+
+# Statistical profiler: a background thread samples every thread's stack each interval and
+# counts them in collapsed form ("file:function;file:function N"), which flamegraph.pl and
+# speedscope read directly. Only runs between start() and stop().
+class SamplingProfiler:
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return False
+        self.samples = Counter()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+        self._thread.start()
+        return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.collapsed()
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from embedding_codec import encode_embedding, decode_embedding
+
+MATCH_THRESHOLD = 0.5
+
+
+# Similarity drift introduced by a storage dtype: cosine similarities between pairs of
+# embeddings are computed from the originals and from the encoded/decoded copies.
+def accuracy_check(embeddings, dtype, pairs=20000, seed=0):
+    originals = np.asarray(embeddings, dtype=np.float64)
+    originals /= np.linalg.norm(originals, axis=1, keepdims=True)
+    decoded = np.stack([decode_embedding(encode_embedding(e, dtype)) for e in originals]).astype(np.float64)
+    decoded /= np.linalg.norm(decoded, axis=1, keepdims=True)
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, len(originals), pairs)
+    b = rng.integers(0, len(originals), pairs)
+    before = np.einsum("ij,ij->i", originals[a], originals[b])
+    after = np.einsum("ij,ij->i", decoded[a], decoded[b])
+    drift = np.abs(after - before)
+    flipped = int(np.sum((before >= MATCH_THRESHOLD) != (after >= MATCH_THRESHOLD)))
+
+    return {
+        "dtype": dtype,
+        "bytes_per_embedding": len(encode_embedding(originals[0], dtype)),
+        "self_similarity_min": round(float(np.einsum("ij,ij->i", originals, decoded).min()), 6),
+        "pair_drift_max": round(float(drift.max()), 6),
+        "pair_drift_mean": round(float(drift.mean()), 6),
+        "decisions_flipped": flipped
+    }
+
+
+# Convert legacy BSON-array embeddings in Users to the packed binary format, in place.
+# Re-running only touches documents that still hold an array.
+def migrate(users, dtype, batch_size=1000, dry_run=False):
+    migrated = 0
+    requests = []
+    for user in users.find({"face_embedding": {"$type": "array"}}, {"face_embedding": 1}).batch_size(batch_size):
+        requests.append(UpdateOne({"_id": user["_id"], "face_embedding": {"$type": "array"}},
+                                  {"$set": {"face_embedding": encode_embedding(user["face_embedding"], dtype)}}))
+        if len(requests) >= batch_size:
+            migrated += len(requests) if dry_run else users.bulk_write(requests, ordered=False).modified_count
+            requests = []
+    if requests:
+        migrated += len(requests) if dry_run else users.bulk_write(requests, ordered=False).modified_count
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate Users.face_embedding to packed binary storage")
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"],
+                        default=os.getenv("embedding_storage_dtype", "float32"))
+    parser.add_argument("--check", action="store_true", help="only run the accuracy check")
+    parser.add_argument("--sample", type=int, default=5000, help="users sampled for the accuracy check")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="max allowed similarity drift")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+    users = MongoClient(os.getenv("mongo_URI"))['Liveliness']['Users']
+
+    sample = [decode_embedding(user["face_embedding"]) for user in users.aggregate([
+        {"$match": {"face_embedding": {"$exists": True}}},
+        {"$sample": {"size": args.sample}},
+        {"$project": {"face_embedding": 1}}
+    ])]
+    if len(sample) < 2:
+        # Not enough enrolled users; fall back to synthetic embeddings
+        sample = np.random.default_rng(0).standard_normal((args.sample, 512))
+
+    report = accuracy_check(sample, args.dtype)
+    print(report)
+    if report["pair_drift_max"] > args.tolerance:
+        print(f"Similarity drift {report['pair_drift_max']} exceeds tolerance {args.tolerance}; not migrating")
+        return 1
+    if args.check:
+        return 0
+
+    print("Migrated" if not args.dry_run else "Would migrate", migrate(users, args.dtype, dry_run=args.dry_run), "users")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import functools
+import hashlib
+import os
+import time
+from flask import request, make_response, current_app
+from metrics import registry as metrics
+
+
+# Short-TTL cache for one dashboard response. The dashboard routes take no query
+# parameters, so there is exactly one entry per view: cache-busting query strings
+# (?_=<timestamp>) share it instead of adding entries, and memory stays fixed.
+class ResponseCache:
+    def __init__(self, route, ttl=None):
+        self.route = route
+        self.ttl = ttl if ttl is not None else float(os.getenv("dashboard_cache_ttl", 30))
+        self._entry = None
+
+    # (expires_at, body, etag) while fresh, else None
+    def get(self):
+        entry = self._entry
+        hit = entry is not None and entry[0] >= time.monotonic()
+        metrics.inc("response_cache_requests_total", route=self.route, result="hit" if hit else "miss")
+        return entry if hit else None
+
+    def put(self, body):
+        self._entry = (time.monotonic() + self.ttl, body, hashlib.md5(body).hexdigest())
+        return self._entry
+
+
+# Response cache with ETag support for the Flask dashboard GETs
+def cached_json(ttl=None):
+    def decorator(fn):
+        cache = ResponseCache(fn.__name__, ttl)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            entry = cache.get()
+            if entry is None:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = cache.put(response.get_data())
+
+            response = current_app.response_class(entry[1], mimetype="application/json")
+            response.set_etag(entry[2])
+            response.cache_control.max_age = int(cache.ttl)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+# Same for the async routes in asgi.py, which return plain data (or an error tuple)
+def async_cached_json(ttl=None):
+    from quart import request as async_request, current_app as async_app, Response
+
+    def decorator(fn):
+        cache = ResponseCache(fn.__name__, ttl)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            entry = cache.get()
+            if entry is None:
+                result = await fn(*args, **kwargs)
+                if isinstance(result, tuple):
+                    return result
+                entry = cache.put(async_app.json.dumps(result).encode())
+
+            if entry[2] in async_request.if_none_match:
+                response = Response(b"", status=304)
+            else:
+                response = Response(entry[1], mimetype="application/json")
+            response.set_etag(entry[2])
+            response.cache_control.max_age = int(cache.ttl)
+            return response
+        return wrapper
+    return decorator
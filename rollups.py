@@ -0,0 +1,225 @@
+import datetime
+import os
+import sys
+from collections import defaultdict
+from pymongo import UpdateOne
+
+
+def day_key(timestamp):
+    return timestamp.strftime("%Y-%m-%d")
+
+
+# Statuses the API writes to Logs. Anything else (status is client input on /log-verification)
+# is counted under "other" so it can't add arbitrary fields to the rollups.
+LOG_STATUSES = ("Verified", "Rejected", "In Process", "Admin Login")
+
+
+def status_key(status):
+    return status if status in LOG_STATUSES else "other"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# Per-day counters behind the dashboard endpoints, kept up to date as logs are written.
+#   DailyRollups:   {_id: "YYYY-MM-DD", status: {<status or "other">: n}, time_taken_sum, time_taken_count, new_users}
+#   ActiveUserDays: {_id: "YYYY-MM-DD|email", date, email}, one per user per day with a successful login
+# Dashboard reads then touch at most one document per day (or per active user per day),
+# however large Logs gets.
+class Rollups:
+    def __init__(self, db):
+        self.daily = db["DailyRollups"]
+        self.active = db["ActiveUserDays"]
+
+    @staticmethod
+    def _log_increments(logs):
+        increments = defaultdict(lambda: defaultdict(int))
+        active = set()
+        for log in logs:
+            date = day_key(log["timestamp"])
+            increments[date]["status." + status_key(log.get("status"))] += 1
+            if _is_number(log.get("time_taken")):
+                increments[date]["time_taken_sum"] += log["time_taken"]
+                increments[date]["time_taken_count"] += 1
+            if log.get("login_status"):
+                active.add((date, log["email"]))
+        return increments, active
+
+    @staticmethod
+    def _daily_updates(increments):
+        return [UpdateOne({"_id": date}, {"$inc": dict(fields)}, upsert=True)
+                for date, fields in increments.items() if fields]
+
+    @staticmethod
+    def _active_updates(active):
+        return [UpdateOne({"_id": f"{date}|{email}"}, {"$setOnInsert": {"date": date, "email": email}}, upsert=True)
+                for date, email in active]
+
+    def _apply(self, increments, active):
+        if increments:
+            self.daily.bulk_write(self._daily_updates(increments), ordered=False)
+        if active:
+            self.active.bulk_write(self._active_updates(active), ordered=False)
+
+    # Called with every batch of newly inserted Logs documents
+    def record_logs(self, logs):
+        self._apply(*self._log_increments(logs))
+
+    # /log-verification rewrites an existing log: move it out of its old day/status and into the new one
+    def record_log_update(self, before, after):
+        increments = defaultdict(lambda: defaultdict(int))
+        old_date = day_key(before["timestamp"])
+        increments[old_date]["status." + status_key(before.get("status"))] -= 1
+        if _is_number(before.get("time_taken")):
+            increments[old_date]["time_taken_sum"] -= before["time_taken"]
+            increments[old_date]["time_taken_count"] -= 1
+
+        new_increments, active = self._log_increments([dict(before, **after)])
+        for date, fields in new_increments.items():
+            for field, value in fields.items():
+                increments[date][field] += value
+        self._apply(increments, active)
+
+    def record_registration(self, timestamp, count=1):
+        if count:
+            self.daily.update_one({"_id": day_key(timestamp)}, {"$inc": {"new_users": count}}, upsert=True)
+
+    # ----------------- Readers -----------------
+    # Queries come from the static helpers below so AsyncRollups can share them
+    @staticmethod
+    def _days_query(start, end):
+        return {"_id": {"$gte": day_key(start), "$lt": day_key(end)}}
+
+    @staticmethod
+    def _active_per_day_pipeline(start, end):
+        return [
+            {"$match": {"date": {"$gte": day_key(start), "$lt": day_key(end)}}},
+            {"$group": {"_id": "$date", "count": {"$sum": 1}}}
+        ]
+
+    @staticmethod
+    def _unique_active_pipeline(start, end):
+        return [
+            {"$match": {"date": {"$gte": day_key(start), "$lt": day_key(end)}}},
+            {"$group": {"_id": "$email"}},
+            {"$count": "count"}
+        ]
+
+    @staticmethod
+    def _status_totals_pipeline(statuses):
+        return [{"$group": dict({"_id": None}, **{status: {"$sum": "$status." + status} for status in statuses})}]
+
+    def days(self, start, end):
+        return {doc["_id"]: doc for doc in self.daily.find(self._days_query(start, end))}
+
+    def active_users_per_day(self, start, end):
+        return {doc["_id"]: doc["count"] for doc in self.active.aggregate(self._active_per_day_pipeline(start, end))}
+
+    def unique_active_users(self, start, end):
+        result = list(self.active.aggregate(self._unique_active_pipeline(start, end)))
+        return result[0]["count"] if result else 0
+
+    def status_totals(self, statuses):
+        result = list(self.daily.aggregate(self._status_totals_pipeline(statuses)))
+        return {status: (result[0][status] if result else 0) for status in statuses}
+
+    # ----------------- Backfill -----------------
+    # Rebuild all rollups from Logs and Users. Safe to re-run; existing rollups are replaced.
+    # logs_collection can be a LogStore; logs already expired or archived are not counted again.
+    def backfill(self, logs_collection, users_collection):
+        day = {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}
+        daily = defaultdict(lambda: {"status": {}, "time_taken_sum": 0, "time_taken_count": 0, "new_users": 0})
+
+        for doc in logs_collection.aggregate([
+            {"$match": {"timestamp": {"$type": "date"}}},
+            {"$group": {
+                "_id": {"date": day, "status": "$status"},
+                "count": {"$sum": 1},
+                "time_taken_sum": {"$sum": {"$cond": [{"$isNumber": "$time_taken"}, "$time_taken", 0]}},
+                "time_taken_count": {"$sum": {"$cond": [{"$isNumber": "$time_taken"}, 1, 0]}}
+            }}
+        ], allowDiskUse=True):
+            entry = daily[doc["_id"]["date"]]
+            key = status_key(doc["_id"].get("status"))
+            entry["status"][key] = entry["status"].get(key, 0) + doc["count"]
+            entry["time_taken_sum"] += doc["time_taken_sum"]
+            entry["time_taken_count"] += doc["time_taken_count"]
+
+        for doc in users_collection.aggregate([
+            {"$match": {"timestamp": {"$type": "date"}}},
+            {"$group": {"_id": day, "count": {"$sum": 1}}}
+        ]):
+            daily[doc["_id"]]["new_users"] = doc["count"]
+
+        self.daily.delete_many({})
+        if daily:
+            self.daily.insert_many([dict({"_id": date}, **fields) for date, fields in daily.items()])
+
+        self.active.delete_many({})
+        batch = []
+        for doc in logs_collection.aggregate([
+            {"$match": {"login_status": True, "timestamp": {"$type": "date"}}},
+            {"$group": {"_id": {"date": day, "email": "$email"}}}
+        ], allowDiskUse=True):
+            date, email = doc["_id"]["date"], doc["_id"]["email"]
+            batch.append({"_id": f"{date}|{email}", "date": date, "email": email})
+            if len(batch) >= 10000:
+                self.active.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            self.active.insert_many(batch, ordered=False)
+
+        return {"days": len(daily), "active_user_days": self.active.estimated_document_count()}
+
+
+# Same rollups over Motor collections, for the async serving mode (asgi.py). Only the
+# readers and the writers used by async routes are async; record_log_update and backfill
+# belong to the synchronous app and scripts.
+class AsyncRollups(Rollups):
+    async def _apply(self, increments, active):
+        if increments:
+            await self.daily.bulk_write(self._daily_updates(increments), ordered=False)
+        if active:
+            await self.active.bulk_write(self._active_updates(active), ordered=False)
+
+    async def record_logs(self, logs):
+        await self._apply(*self._log_increments(logs))
+
+    async def record_registration(self, timestamp, count=1):
+        if count:
+            await self.daily.update_one({"_id": day_key(timestamp)}, {"$inc": {"new_users": count}}, upsert=True)
+
+    async def days(self, start, end):
+        return {doc["_id"]: doc async for doc in self.daily.find(self._days_query(start, end))}
+
+    async def active_users_per_day(self, start, end):
+        pipeline = self._active_per_day_pipeline(start, end)
+        return {doc["_id"]: doc["count"] async for doc in self.active.aggregate(pipeline)}
+
+    async def unique_active_users(self, start, end):
+        result = await self.active.aggregate(self._unique_active_pipeline(start, end)).to_list(1)
+        return result[0]["count"] if result else 0
+
+    async def status_totals(self, statuses):
+        result = await self.daily.aggregate(self._status_totals_pipeline(statuses)).to_list(1)
+        return {status: (result[0][status] if result else 0) for status in statuses}
+
+
+# Usage: python rollups.py backfill
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python rollups.py backfill")
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from schema import ensure_indexes
+    from log_store import log_store_from_env
+
+    load_dotenv()
+    db = MongoClient(os.getenv("mongo_URI"))['Liveliness']
+    ensure_indexes(db)
+    start = datetime.datetime.now()
+    print(Rollups(db).backfill(log_store_from_env(db), db["Users"]))
+    print("Backfill took", datetime.datetime.now() - start)
@@ -0,0 +1,154 @@
+import datetime
+import os
+import sys
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+
+# Indexes behind every hot lookup, per collection: (keys, options).
+#   Users / Admins / ChallengeLogs: looked up and upserted by email on every login, register and /verify
+#   ActiveUserDays: the dashboard rollups filter on date and group by email
+# DailyRollups and ChallengeStats are keyed by day in _id and need nothing extra.
+INDEXES = {
+    "Users": [([("email", 1)], {"unique": True})],
+    "Admins": [([("email", 1)], {"unique": True})],
+    "ChallengeLogs": [([("email", 1)], {"unique": True})],
+    "ActiveUserDays": [([("date", 1), ("email", 1)], {})]
+}
+
+# Indexes on every log collection (Logs, or each monthly bucket; see log_store.py):
+# /get-logs pages on (timestamp, _id) with optional email or status filters,
+# /log-verification finds by email, /get-top-rejected-users matches on status
+LOG_INDEXES = [
+    ([("timestamp", -1), ("_id", -1)], {}),
+    ([("email", 1), ("timestamp", -1), ("_id", -1)], {}),
+    ([("status", 1), ("timestamp", -1), ("_id", -1)], {})
+]
+
+
+# Create indexes on one collection; already existing ones are a no-op on the server.
+# A failure (e.g. duplicate emails blocking a unique index) is printed and the rest still get created.
+def create_indexes(collection, indexes):
+    created = []
+    for keys, options in indexes:
+        try:
+            created.append(f"{collection.name}.{collection.create_index(keys, **options)}")
+        except PyMongoError as e:
+            print(f"Could not create index {keys} on {collection.name}: {e}")
+    return created
+
+
+# Every declared index outside the log collections, which LogStore.ensure_indexes covers
+def ensure_indexes(db):
+    created = []
+    for collection, indexes in INDEXES.items():
+        created.extend(create_indexes(db[collection], indexes))
+    return created
+
+
+# ----------------- Query plan checks -----------------
+# The query shapes the API runs in production, as explain commands. Log and rollup reads
+# are built by the same helpers the handlers use (log_store.build_log_query and friends,
+# the Rollups query helpers), so they can't drift; the single-document lookups and upserts
+# are spelled out here and need updating when a handler's changes.
+# Whole-collection reads are left out on purpose: /get-failed-tasks and the rollup status
+# totals group over every document of small per-user/per-day collections, and the backfill
+# and migration scripts read everything by design.
+def production_queries(log_collection="Logs"):
+    from log_store import LOG_ORDER, build_log_query, encode_log_cursor, top_rejected_pipeline
+    from rollups import Rollups
+
+    email = "schema-check@example.com"
+    now = datetime.datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    week_ago = now - datetime.timedelta(days=7)
+    log_order = dict(LOG_ORDER)
+
+    def get_logs(args, limit=100):
+        return {"find": log_collection, "filter": build_log_query(args)[0], "sort": log_order, "limit": limit}
+
+    return {
+        "users_by_email": {"find": "Users", "filter": {"email": email}, "projection": {"face_embedding": 1, "_id": 0},
+                           "limit": 1},
+        "user_image_status": {"update": "Users", "updates": [
+            {"q": {"email": email}, "u": {"$set": {"user_image_status": "stored"}}}]},
+        "admins_by_email": {"find": "Admins", "filter": {"email": email}, "projection": {"_id": 1}, "limit": 1},
+        "challenge_logs_upsert": {"update": "ChallengeLogs", "updates": [
+            {"q": {"email": email}, "u": {"$inc": {"correct_Front": 1}}, "upsert": True}]},
+        "challenge_stats_upsert": {"update": "ChallengeStats", "updates": [
+            {"q": {"_id": today}, "u": {"$inc": {"correct_Front": 1}}, "upsert": True}]},
+        "challenge_stats_daily": {"find": "ChallengeStats", "filter": {"_id": {"$gte": today}}},
+        "log_location_update": {"update": log_collection, "updates": [
+            {"q": {"_id": ObjectId()}, "u": {"$set": {"location": {}}}}]},
+        "log_verification": {"findAndModify": log_collection, "query": {"email": email},
+                             "update": {"$set": {"verification_status": True}}},
+        "get_logs": get_logs({}),
+        "get_logs_next_page": get_logs({"cursor": encode_log_cursor({"timestamp": now, "_id": ObjectId()})}),
+        "get_logs_by_email": get_logs({"email": email}),
+        "get_logs_by_status": get_logs({"status": "Rejected"}),
+        "get_logs_by_range": get_logs({"start": week_ago.isoformat(), "end": now.isoformat()}),
+        "top_rejected_users": {"aggregate": log_collection, "cursor": {}, "pipeline": top_rejected_pipeline()},
+        "top_rejected_users_recent": {"aggregate": log_collection, "cursor": {},
+                                      "pipeline": top_rejected_pipeline(week_ago)},
+        "rollup_days": {"find": "DailyRollups", "filter": Rollups._days_query(week_ago, now)},
+        "rollup_registration": {"update": "DailyRollups", "updates": [
+            {"q": {"_id": today}, "u": {"$inc": {"new_users": 1}}, "upsert": True}]},
+        "active_users_per_day": {"aggregate": "ActiveUserDays", "cursor": {},
+                                 "pipeline": Rollups._active_per_day_pipeline(week_ago, now)},
+        "unique_active_users": {"aggregate": "ActiveUserDays", "cursor": {},
+                                "pipeline": Rollups._unique_active_pipeline(week_ago, now)}
+    }
+
+
+# Stage names of the winning plan, wherever the server nests it (find, update,
+# findAndModify, aggregate with or without a $cursor stage, classic or SBE)
+def plan_stages(explain):
+    stages = []
+    if isinstance(explain, dict):
+        if isinstance(explain.get("stage"), str):
+            stages.append(explain["stage"])
+        for key, value in explain.items():
+            if key != "rejectedPlans":
+                stages.extend(plan_stages(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+# Explain every production query; returns {name: stages} for the ones that scan a whole collection.
+# Log queries are explained against log_collection (the current monthly bucket in monthly mode).
+def check_query_plans(db, log_collection="Logs"):
+    failures = {}
+    for name, command in production_queries(log_collection).items():
+        stages = plan_stages(db.command("explain", command, verbosity="queryPlanner"))
+        print(f"{name:<24} {' > '.join(stages)}")
+        if "COLLSCAN" in stages:
+            failures[name] = stages
+    return failures
+
+
+# Usage: python schema.py ensure
+#        python schema.py check [--no-create]
+# check creates the declared indexes first (unless --no-create, to check a database as it
+# is), then explains every production query and exits with 1 if any of them is a COLLSCAN.
+if __name__ == "__main__":
+    if sys.argv[1:2] not in (["ensure"], ["check"]):
+        print("Usage: python schema.py ensure | check [--no-create]")
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from log_store import log_store_from_env
+
+    load_dotenv()
+    db = MongoClient(os.getenv("mongo_URI"))['Liveliness']
+    log_store = log_store_from_env(db)
+    if sys.argv[1] == "ensure" or "--no-create" not in sys.argv:
+        print("Indexes:", ", ".join(ensure_indexes(db) + log_store.ensure_indexes()))
+    if sys.argv[1] == "check":
+        failures = check_query_plans(db, log_store.collection_for(datetime.datetime.now()).name)
+        if failures:
+            print("Collection scans:", ", ".join(failures))
+            sys.exit(1)
+        print("No collection scans")
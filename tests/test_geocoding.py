@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+pytest.importorskip("requests")
+from geocoding import Geocoder, UNKNOWN_LOCATION
+
+LOCATION = {"locality": "Indiranagar", "city": "Bengaluru", "principalSubdivision": "Karnataka",
+            "countryName": "India"}
+
+
+# Local stand-in for bigdatacloud: counts requests and answers after server.delay seconds
+@pytest.fixture
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            httpd.requests += 1
+            time.sleep(httpd.delay)
+            body = json.dumps(LOCATION).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests = 0
+    httpd.delay = 0
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/reverse-geocode-client"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_nearby_lookups_share_a_cache_cell(server):
+    geocoder = Geocoder(base_url=server.url, timeout=1.0)
+    expected = {"city": "Bengaluru", "state": "Karnataka", "country": "India"}
+
+    assert geocoder.lookup(12.9716, 77.5946) == expected
+    assert geocoder.lookup(12.9718, 77.5949) == expected
+    assert server.requests == 1
+    assert geocoder.stats()["hits"] == 1
+    assert geocoder.stats()["misses"] == 1
+
+
+def test_timeout_falls_back_to_unknown_and_is_not_cached(server):
+    server.delay = 0.5
+    geocoder = Geocoder(base_url=server.url, timeout=0.1)
+
+    assert geocoder.lookup(12.97, 77.59) == UNKNOWN_LOCATION
+    assert geocoder.stats()["errors"] == 1
+    assert geocoder.cached(12.97, 77.59) is None
+
+    server.delay = 0
+    assert geocoder.lookup(12.97, 77.59)["city"] == "Bengaluru"
+
+
+def test_deferred_lookup_fills_in_the_location(server):
+    geocoder = Geocoder(base_url=server.url, timeout=1.0)
+    filled = []
+
+    assert geocoder.cached(12.97, 77.59) is None
+    geocoder.lookup_deferred(12.97, 77.59, filled.append).result(timeout=5)
+
+    assert filled == [{"city": "Bengaluru", "state": "Karnataka", "country": "India"}]
+    assert geocoder.cached(12.97, 77.59) == filled[0]
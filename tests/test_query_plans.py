@@ -0,0 +1,29 @@
+import datetime
+import os
+import pytest
+
+pytest.importorskip("pymongo")
+if not os.getenv("mongo_URI"):
+    pytest.skip("mongo_URI not set", allow_module_level=True)
+
+from pymongo import MongoClient
+from log_store import LogStore
+from schema import ensure_indexes, check_query_plans
+
+
+# Declared indexes on a scratch database, then every production query must avoid a COLLSCAN
+@pytest.mark.parametrize("mode", ["single", "monthly"])
+def test_production_queries_use_indexes(mode):
+    client = MongoClient(os.getenv("mongo_URI"))
+    name = os.getenv("query_plan_test_db", "Liveliness_query_plans")
+    client.drop_database(name)
+    db = client[name]
+    try:
+        log_store = LogStore(db, mode=mode)
+        ensure_indexes(db)
+        log_store.ensure_indexes()
+
+        assert check_query_plans(db, log_store.collection_for(datetime.datetime.now()).name) == {}
+    finally:
+        client.drop_database(name)
+        client.close()
@@ -0,0 +1,128 @@
+import importlib
+import multiprocessing
+import queue
+import threading
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+
+
+class PoolBusy(Exception):
+    pass
+
+
+def _load_handler(handler_path):
+    module_name, func_name = handler_path.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+# Runs inside each worker process: load the handler and run the optional init hook once,
+# then serve frames that the parent wrote into this worker's shared-memory slot
+def _worker_main(handler_path, init_path, shm_name, conn):
+    handler = _load_handler(handler_path)
+    if init_path:
+        _load_handler(init_path)()
+    shm = SharedMemory(name=shm_name)
+    conn.send("ready")
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        shape, dtype, args = message
+        frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        try:
+            conn.send(("ok", handler(frame, *args)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+        del frame
+    shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, handler_path, init_path, max_frame_bytes):
+        self.shm = SharedMemory(create=True, size=max_frame_bytes)
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(handler_path, init_path, self.shm.name, child_conn),
+                                   daemon=True)
+        self.process.start()
+        self.conn.recv()
+
+    # join_timeout=0 for a worker that is stuck and won't read the stop message
+    def close(self, join_timeout=5):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=join_timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Pool of model worker processes. Each worker owns one shared-memory slot, so a frame is
+# copied once into shared memory instead of being pickled; only shape/dtype and the small
+# result dict cross the pipe. Callers wait up to acquire_timeout for an idle worker and get
+# PoolBusy otherwise, which the web tier turns into a 503. A worker that hasn't answered
+# within run_timeout is killed and replaced, so a hung model can't hold a slot forever.
+# If init_path is given, each worker calls it once before reporting ready (e.g. to warm
+# up its models).
+class ModelWorkerPool:
+    def __init__(self, handler_path, num_workers=2, max_frame_bytes=3840 * 2160 * 3, acquire_timeout=5,
+                 init_path=None, run_timeout=30):
+        self.handler_path = handler_path
+        self.init_path = init_path
+        self.max_frame_bytes = max_frame_bytes
+        self.acquire_timeout = acquire_timeout
+        self.run_timeout = run_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        for _ in range(num_workers):
+            worker = _Worker(self._ctx, handler_path, init_path, max_frame_bytes)
+            self._workers.append(worker)
+            self._idle.put(worker)
+
+    # Extra args are pickled alongside shape/dtype, so keep them small
+    def run(self, frame, *args):
+        frame = np.ascontiguousarray(frame)
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds worker slot of {self.max_frame_bytes} bytes")
+
+        try:
+            worker = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise PoolBusy("All model workers are busy")
+
+        try:
+            slot = np.ndarray(frame.shape, dtype=frame.dtype, buffer=worker.shm.buf)
+            slot[...] = frame
+            del slot
+            worker.conn.send((frame.shape, frame.dtype.str, args))
+            if not worker.conn.poll(self.run_timeout):
+                worker = self._replace(worker, join_timeout=0)
+                raise RuntimeError(f"Model worker did not answer within {self.run_timeout}s")
+            status, result = worker.conn.recv()
+        except (EOFError, BrokenPipeError, OSError):
+            worker = self._replace(worker)
+            raise RuntimeError("Model worker died while processing frame")
+        finally:
+            self._idle.put(worker)
+
+        if status == "error":
+            raise RuntimeError(f"Model worker error: {result}")
+        return result
+
+    def _replace(self, worker, join_timeout=5):
+        with self._lock:
+            worker.close(join_timeout)
+            new_worker = _Worker(self._ctx, self.handler_path, self.init_path, self.max_frame_bytes)
+            self._workers[self._workers.index(worker)] = new_worker
+            return new_worker
+
+    def stats(self):
+        return {"workers": len(self._workers), "idle": self._idle.qsize()}
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()